@@ -0,0 +1,278 @@
+import pickle
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from core.sqlite import Connections, immediate
+
+SCHEMA = '''
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO cache_stats (name) VALUES
+    ('entries'), ('bytes'), ('culls'), ('evicted'), ('expired');
+CREATE TRIGGER IF NOT EXISTS cache_inserted AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats SET value = value + 1 WHERE name = 'entries';
+    UPDATE cache_stats SET value = value + NEW.size WHERE name = 'bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS cache_deleted AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats SET value = value - 1 WHERE name = 'entries';
+    UPDATE cache_stats SET value = value - OLD.size WHERE name = 'bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS cache_resized AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE cache_stats SET value = value + NEW.size - OLD.size
+    WHERE name = 'bytes';
+END;
+COMMIT;
+'''
+
+# Время последнего чтения обновляется не чаще раза в секунду:
+# для LRU этого хватает, а горячие ключи не пишут в файл на каждый get.
+ACCESS_RESOLUTION = 1.0
+
+MAX_INTEGER = 2 ** 63
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite, общий для всех процессов на машине.
+
+    LOCATION — путь к файлу. Кроме MAX_ENTRIES и CULL_FREQUENCY
+    понимает OPTIONS MAX_SIZE (предел суммарного размера значений
+    в байтах) и MMAP_SIZE. При превышении любого предела удаляются
+    просроченные записи, затем давно не читанные, пока не останется
+    (1 - 1/CULL_FREQUENCY) от предела. add() и incr() выполняются
+    под блокировкой записи (BEGIN IMMEDIATE) и атомарны между
+    процессами; целые числа хранятся как INTEGER, без pickle.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self._mmap_size = int(options.get('MMAP_SIZE', self._max_size))
+        self._connections = Connections(
+            SCHEMA, pragmas=(f'mmap_size={self._mmap_size}',))
+
+    @property
+    def _db(self):
+        return self._connections.get(self._path)
+
+    def _transaction(self, db=None):
+        return immediate(db or self._db)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    @staticmethod
+    def _encode(value):
+        if type(value) is int and -MAX_INTEGER <= value < MAX_INTEGER:
+            return value, 8
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return data, len(data)
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    @staticmethod
+    def _is_live(expires, now):
+        return expires is None or expires > now
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is not None and self._is_live(row[0], now):
+                return False
+            self._store(db, key, value, timeout, now)
+            self._cull(db, now)
+        return True
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        db = self._db
+        row = db.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?',
+            (key,)).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        if not self._is_live(expires, now):
+            self._expire(db, [key], now)
+            return default
+        if now - accessed >= ACCESS_RESOLUTION:
+            db.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return self._decode(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            self._store(db, key, value, timeout, now)
+            self._cull(db, now)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            updated = db.execute(
+                'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), now, key, now),
+            ).rowcount
+        return bool(updated)
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            deleted = db.execute(
+                'DELETE FROM cache WHERE key = ?', (key,)).rowcount
+        return bool(deleted)
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._db.execute(
+            'SELECT expires FROM cache WHERE key = ?', (key,)).fetchone()
+        return row is not None and self._is_live(row[0], time.time())
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT value, expires FROM cache WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or not self._is_live(row[1], now):
+                raise ValueError("Key '%s' not found" % key)
+            value = self._decode(row[0]) + delta
+            encoded, size = self._encode(value)
+            db.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ? '
+                'WHERE key = ?', (encoded, size, now, key))
+        return value
+
+    def get_many(self, keys, version=None):
+        made = {self._key(key, version): key for key in keys}
+        now = time.time()
+        db = self._db
+        found, expired = {}, []
+        names = list(made)
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            rows = db.execute(
+                'SELECT key, value, expires FROM cache WHERE key IN (%s)'
+                % ', '.join('?' * len(chunk)), chunk)
+            for key, value, expires in rows:
+                if self._is_live(expires, now):
+                    found[made[key]] = self._decode(value)
+                else:
+                    expired.append(key)
+        if expired:
+            self._expire(db, expired, now)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        with self._transaction() as db:
+            for key, value in data.items():
+                self._store(
+                    db, self._key(key, version), value, timeout, now)
+            self._cull(db, now)
+        return []
+
+    def delete_many(self, keys, version=None):
+        names = [self._key(key, version) for key in keys]
+        with self._transaction() as db:
+            for start in range(0, len(names), 500):
+                chunk = names[start:start + 500]
+                db.execute(
+                    'DELETE FROM cache WHERE key IN (%s)'
+                    % ', '.join('?' * len(chunk)), chunk)
+
+    def clear(self):
+        with self._transaction() as db:
+            db.execute('DELETE FROM cache')
+
+    def stats(self):
+        """Число и размер записей, число чисток и удалённых ими записей."""
+        stats = dict(self._db.execute('SELECT name, value FROM cache_stats'))
+        stats.update(max_entries=self._max_entries, max_size=self._max_size)
+        return stats
+
+    def _store(self, db, key, value, timeout, now):
+        encoded, size = self._encode(value)
+        db.execute(
+            'INSERT INTO cache (key, value, expires, accessed, size) '
+            'VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+            'value = excluded.value, expires = excluded.expires, '
+            'accessed = excluded.accessed, size = excluded.size',
+            (key, encoded, self.get_backend_timeout(timeout), now, size))
+
+    def _expire(self, db, keys, now):
+        # Условие по expires: запись могли перезаписать, пока мы читали.
+        with self._transaction(db):
+            removed = sum(
+                db.execute(
+                    'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                    (key, now)).rowcount
+                for key in keys)
+            self._count(db, 'expired', removed)
+
+    def _cull(self, db, now):
+        entries, size = self._totals(db)
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        removed = db.execute(
+            'DELETE FROM cache WHERE expires <= ?', (now,)).rowcount
+        self._count(db, 'expired', removed)
+        entries, size = self._totals(db)
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        keep = 1 - 1 / self._cull_frequency if self._cull_frequency else 0
+        evicted = db.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM ('
+            '  SELECT key,'
+            '   ROW_NUMBER() OVER recent AS position,'
+            '   SUM(size) OVER recent AS total'
+            '  FROM cache WINDOW recent AS (ORDER BY accessed DESC)'
+            ' ) WHERE position > ? OR total > ?)',
+            (int(self._max_entries * keep), int(self._max_size * keep)),
+        ).rowcount
+        self._count(db, 'culls', 1)
+        self._count(db, 'evicted', evicted)
+
+    @staticmethod
+    def _totals(db):
+        stats = dict(db.execute(
+            "SELECT name, value FROM cache_stats "
+            "WHERE name IN ('entries', 'bytes')"))
+        return stats['entries'], stats['bytes']
+
+    @staticmethod
+    def _count(db, name, delta):
+        if delta:
+            db.execute(
+                'UPDATE cache_stats SET value = value + ? WHERE name = ?',
+                (delta, name))
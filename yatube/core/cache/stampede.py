@@ -0,0 +1,84 @@
+import math
+import random
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from core.instrumentation import record_cache
+
+# Значение, время его расчёта в секундах и момент, когда оно устареет.
+Entry = namedtuple('Entry', 'value delta expires')
+
+LOCK_KEY = '{}:lock'
+POLL_INTERVAL = 0.05
+
+
+def get_or_set(key, compute, timeout=DEFAULT_TIMEOUT, cache=None, beta=None):
+    """Вернуть значение из кеша, пересчитав его не больше одного раза.
+
+    Незадолго до истечения срока значение с вероятностью, растущей
+    к концу срока и со временем расчёта, пересчитывается заранее
+    (probabilistic early expiration, beta — её агрессивность).
+    Пересчитывает только процесс, взявший блокировку ключа; остальные
+    отдают старое значение, которое хранится ещё CACHE_STALE_TIMEOUT
+    секунд после срока. Если старого значения нет, они ждут
+    до CACHE_LOCK_WAIT секунд и лишь потом считают сами.
+    """
+    cache = cache or default_cache
+    if timeout is DEFAULT_TIMEOUT:
+        timeout = cache.default_timeout
+    if beta is None:
+        beta = settings.CACHE_EARLY_RECOMPUTE_BETA
+    entry = cache.get(key)
+    record_cache(entry is not None)
+    if entry is not None and not isinstance(entry, Entry):
+        # Записано обычным {% cache %} или cache.set().
+        return entry
+    if entry is not None and not should_recompute(entry, beta):
+        return entry.value
+    lock_key = LOCK_KEY.format(key)
+    if cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT):
+        try:
+            return _compute(cache, key, compute, timeout)
+        finally:
+            cache.delete(lock_key)
+    if entry is not None:
+        return entry.value
+    entry = _wait(cache, key)
+    if entry is not None:
+        return entry.value
+    return compute()
+
+
+def should_recompute(entry, beta):
+    # 1 - random() лежит в (0, 1], логарифм от него не падает.
+    early = entry.delta * beta * math.log(1 - random.random())
+    return time.time() - early >= entry.expires
+
+
+def _compute(cache, key, compute, timeout):
+    started = time.monotonic()
+    value = compute()
+    if timeout is not None and timeout <= 0:
+        return value
+    delta = time.monotonic() - started
+    if timeout is None:
+        expires, stored_for = math.inf, None
+    else:
+        expires = time.time() + timeout
+        stored_for = timeout + settings.CACHE_STALE_TIMEOUT
+    cache.set(key, Entry(value, delta, expires), stored_for)
+    return value
+
+
+def _wait(cache, key):
+    deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if isinstance(entry, Entry):
+            return entry
+    return None
@@ -0,0 +1,219 @@
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+STAMP_KEY = 'tiered_stamp:{}'
+
+# Префикс ключа для статистики и штампов: часть до двоеточия, а у
+# фрагментов {% cache %} — template.cache.<имя фрагмента>.
+PREFIX_RE = re.compile(r'template\.cache\.[^.]+|[^:]+')
+
+MISSING = object()
+
+
+def key_prefix(key):
+    match = PREFIX_RE.match(str(key))
+    return match.group() if match else ''
+
+
+class TieredCache(BaseCache):
+    """Маленький LRU в памяти процесса перед любым кешем из CACHES.
+
+    OPTIONS: BACKEND — имя общего кеша в CACHES, LOCAL_MAX_ENTRIES
+    и LOCAL_TIMEOUT — размер и срок жизни записей в памяти,
+    STAMP_INTERVAL — как часто сверять штампы. Любая запись через
+    обёртку увеличивает штамп префикса ключа в общем кеше; остальные
+    процессы замечают это не позже чем через STAMP_INTERVAL секунд
+    и перестают отдавать свои копии ключей с этим префиксом.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('BACKEND', 'shared')
+        self._local_max_entries = int(options.get('LOCAL_MAX_ENTRIES', 1000))
+        self._local_timeout = float(options.get('LOCAL_TIMEOUT', 5))
+        self._stamp_interval = float(options.get('STAMP_INTERVAL', 1))
+        self._local = OrderedDict()
+        self._stamps = {}
+        self._stamps_checked = 0.0
+        self._lock = threading.RLock()
+        self._stats = defaultdict(lambda: defaultdict(int))
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def get(self, key, default=None, version=None):
+        value = self._get_local(key, version)
+        if value is not MISSING:
+            return value
+        value = self.shared.get(key, MISSING, version=version)
+        self._record(key, 'shared', value is not MISSING)
+        if value is MISSING:
+            return default
+        self._set_local(key, version, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found, rest = {}, []
+        for key in keys:
+            value = self._get_local(key, version)
+            if value is MISSING:
+                rest.append(key)
+            else:
+                found[key] = value
+        if rest:
+            fetched = self.shared.get_many(rest, version=version)
+            for key in rest:
+                self._record(key, 'shared', key in fetched)
+            for key, value in fetched.items():
+                self._set_local(key, version, value)
+            found.update(fetched)
+        return found
+
+    def has_key(self, key, version=None):
+        if self._get_local(key, version, record=False) is not MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._changed([key])
+        self._set_local(key, version, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._changed([key])
+            self._set_local(key, version, value, timeout)
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        self._changed(data)
+        for key, value in data.items():
+            if key not in failed:
+                self._set_local(key, version, value, timeout)
+        return failed
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self._changed([key])
+        self._set_local(key, version, value)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._drop_local([key], version)
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        result = self.shared.delete(key, version=version)
+        self._changed([key])
+        self._drop_local([key], version)
+        return result
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.shared.delete_many(keys, version=version)
+        self._changed(keys)
+        self._drop_local(keys, version)
+
+    def clear(self):
+        self.shared.clear()
+        with self._lock:
+            self._local.clear()
+            self._stamps.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def stats(self):
+        """Попадания и промахи по уровням для каждого префикса ключей."""
+        with self._lock:
+            return {
+                prefix: dict(counts)
+                for prefix, counts in sorted(self._stats.items())
+            }
+
+    def _local_key(self, key, version):
+        return key, self.version if version is None else version
+
+    def _get_local(self, key, version, record=True):
+        now = time.monotonic()
+        prefix = key_prefix(key)
+        stamp = self._current_stamp(prefix, now)
+        local_key = self._local_key(key, version)
+        with self._lock:
+            entry = self._local.get(local_key)
+            hit = (
+                entry is not None
+                and entry[1] > now
+                and entry[2] == stamp
+            )
+            if hit:
+                self._local.move_to_end(local_key)
+            elif entry is not None:
+                del self._local[local_key]
+        if record:
+            self._record(key, 'local', hit)
+        return entry[0] if hit else MISSING
+
+    def _set_local(self, key, version, value, timeout=DEFAULT_TIMEOUT):
+        ttl = self._local_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            self._drop_local([key], version)
+            return
+        now = time.monotonic()
+        stamp = self._current_stamp(key_prefix(key), now)
+        with self._lock:
+            local_key = self._local_key(key, version)
+            self._local[local_key] = (value, now + ttl, stamp)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    def _drop_local(self, keys, version):
+        with self._lock:
+            for key in keys:
+                self._local.pop(self._local_key(key, version), None)
+
+    def _current_stamp(self, prefix, now):
+        with self._lock:
+            stale = now - self._stamps_checked >= self._stamp_interval
+            if prefix in self._stamps and not stale:
+                return self._stamps[prefix]
+            prefixes = set(self._stamps) | {prefix}
+        stamp_keys = {STAMP_KEY.format(name): name for name in prefixes}
+        stamps = self.shared.get_many(list(stamp_keys))
+        with self._lock:
+            self._stamps = {
+                name: stamps.get(key, 0) for key, name in stamp_keys.items()
+            }
+            self._stamps_checked = now
+            return self._stamps[prefix]
+
+    def _changed(self, keys):
+        # Штамп в общем кеше сообщает другим процессам, что их копии
+        # ключей с этим префиксом устарели.
+        for prefix in {key_prefix(key) for key in keys}:
+            stamp_key = STAMP_KEY.format(prefix)
+            try:
+                stamp = self.shared.incr(stamp_key)
+            except ValueError:
+                stamp = int(time.time() * 1000)
+                if not self.shared.add(stamp_key, stamp, None):
+                    stamp = self.shared.incr(stamp_key)
+            with self._lock:
+                self._stamps[prefix] = stamp
+
+    def _record(self, key, tier, hit):
+        with self._lock:
+            self._stats[key_prefix(key)][
+                f'{tier}_hits' if hit else f'{tier}_misses'] += 1
@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar('request_stats', default=None)
+_lock = threading.Lock()
+_aggregate = defaultdict(lambda: defaultdict(float))
+
+
+class RequestStats:
+    """Замеры одного запроса: SQL, шаблоны и обращения к кешу."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        # Глубина вложенных render(): карточки отрисовываются внутри
+        # страницы, и их время уже входит во время страницы.
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.statements = Counter()
+        self.executions = Counter()
+
+    def record_query(self, sql, params, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.statements[sql] += 1
+        self.executions[sql, repr(params)] += 1
+
+    @property
+    def duplicate_queries(self):
+        """Сколько запросов повторили уже выполненный с теми же параметрами."""
+        return sum(count - 1 for count in self.executions.values())
+
+    def most_repeated(self):
+        """Самый частый SQL с разными параметрами — признак N+1."""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+    def as_dict(self):
+        repeated_sql, repeats = self.most_repeated()
+        return {
+            'duration_ms': round(
+                (time.perf_counter() - self.started) * 1000, 2),
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'duplicate_queries': self.duplicate_queries,
+            'most_repeated_query': repeated_sql if repeats > 1 else None,
+            'most_repeated_count': repeats,
+            'template_ms': round(self.template_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+def start():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def timing_template():
+    """Засечь render() шаблона; в template_time идёт только внешний."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    stats.template_depth += 1
+    started = time.perf_counter() if stats.template_depth == 1 else None
+    try:
+        yield
+    finally:
+        stats.template_depth -= 1
+        if started is not None:
+            stats.template_time += time.perf_counter() - started
+
+
+def record_cache(hit):
+    stats = _current.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def query_recorder(execute, sql, params, many, context):
+    """execute_wrapper для connection: считает запросы и их время."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats = _current.get()
+        if stats is not None:
+            stats.record_query(sql, params, time.perf_counter() - started)
+
+
+def add_to_aggregate(url_name, record):
+    with _lock:
+        totals = _aggregate[url_name]
+        totals['requests'] += 1
+        for field in ('duration_ms', 'queries', 'db_ms', 'duplicate_queries',
+                      'template_ms', 'cache_hits', 'cache_misses'):
+            totals[field] += record[field]
+        totals['max_queries'] = max(totals['max_queries'], record['queries'])
+
+
+def summary(url_name=None):
+    """Суммы и средние по URL name с момента запуска процесса."""
+    with _lock:
+        names = [url_name] if url_name else sorted(_aggregate)
+        result = {}
+        for name in names:
+            totals = dict(_aggregate.get(name, {}))
+            requests = totals.get('requests', 0)
+            if not requests:
+                continue
+            result[name] = {
+                **totals,
+                'avg_duration_ms': totals['duration_ms'] / requests,
+                'avg_queries': totals['queries'] / requests,
+                'avg_db_ms': totals['db_ms'] / requests,
+                'avg_template_ms': totals['template_ms'] / requests,
+                'cache_hit_ratio': (
+                    totals['cache_hits']
+                    / (totals['cache_hits'] + totals['cache_misses'])
+                    if totals['cache_hits'] + totals['cache_misses'] else None
+                ),
+            }
+        return result
+
+
+def reset():
+    with _lock:
+        _aggregate.clear()
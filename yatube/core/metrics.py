@@ -0,0 +1,185 @@
+import atexit
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .sqlite import Connections, immediate
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+METRICS = {
+    'yatube_request_duration_seconds': (
+        'histogram', 'Время ответа по URL name и статусу.'),
+    'yatube_db_queries_per_request': (
+        'histogram', 'Число SQL-запросов за запрос.'),
+    'yatube_db_time_seconds': (
+        'histogram', 'Время SQL-запросов за запрос.'),
+    'yatube_cache_requests_total': (
+        'counter', 'Обращения к кешу страниц и фрагментов.'),
+    'yatube_cache_hit_ratio': (
+        'gauge', 'Доля попаданий в кеш страниц и фрагментов.'),
+    'yatube_thumbnail_generation_seconds': (
+        'histogram', 'Время создания миниатюр одной картинки.'),
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+) WITHOUT ROWID;
+'''
+
+_lock = threading.Lock()
+_pending = defaultdict(float)
+_last_flush = time.monotonic()
+_connections = Connections(SCHEMA)
+
+
+def _labels(**labels):
+    return json.dumps(sorted(labels.items()), ensure_ascii=False)
+
+
+def inc(name, value=1, **labels):
+    with _lock:
+        _pending[name, _labels(**labels)] += value
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Добавить наблюдение в гистограмму (накопительные бакеты)."""
+    with _lock:
+        for bound in buckets:
+            _pending[f'{name}_bucket', _labels(le=bound, **labels)] += (
+                value <= bound)
+        _pending[f'{name}_bucket', _labels(le='+Inf', **labels)] += 1
+        _pending[f'{name}_sum', _labels(**labels)] += value
+        _pending[f'{name}_count', _labels(**labels)] += 1
+
+
+def observe_request(url_name, status, record):
+    duration = record['duration_ms'] / 1000
+    observe('yatube_request_duration_seconds', duration,
+            url_name=url_name, status=str(status))
+    observe('yatube_db_queries_per_request', record['queries'],
+            QUERY_COUNT_BUCKETS, url_name=url_name)
+    observe('yatube_db_time_seconds', record['db_ms'] / 1000,
+            url_name=url_name)
+    if record['cache_hits']:
+        inc('yatube_cache_requests_total', record['cache_hits'],
+            result='hit')
+    if record['cache_misses']:
+        inc('yatube_cache_requests_total', record['cache_misses'],
+            result='miss')
+    maybe_flush()
+
+
+def _db():
+    return _connections.get(_path())
+
+
+def _path():
+    return settings.METRICS_PATH
+
+
+def maybe_flush():
+    if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def flush():
+    """Сложить накопленные процессом значения в общий файл метрик."""
+    global _last_flush
+    with _lock:
+        pending = list(_pending.items())
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not pending or not _path():
+        return
+    with immediate(_db()) as db:
+        db.executemany(
+            'INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) '
+            'ON CONFLICT (name, labels) DO UPDATE '
+            'SET value = value + excluded.value',
+            [(name, labels, value) for (name, labels), value in pending])
+
+
+atexit.register(flush)
+
+
+def samples():
+    """Значения всех процессов: {(имя, метки): значение}."""
+    flush()
+    if not _path():
+        return {}
+    rows = _db().execute('SELECT name, labels, value FROM samples')
+    return {(name, labels): value for name, labels, value in rows}
+
+
+def reset():
+    with _lock:
+        _pending.clear()
+    if _path():
+        _db().execute('DELETE FROM samples')
+
+
+def _format_labels(labels):
+    pairs = json.loads(labels)
+    if not pairs:
+        return ''
+    rendered = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in pairs)
+    return '{' + rendered + '}'
+
+
+def _sort_key(sample):
+    (name, labels), _ = sample
+    pairs = json.loads(labels)
+    le = dict(pairs).get('le')
+    others = [pair for pair in pairs if pair[0] != 'le']
+    bound = math.inf if le in (None, '+Inf') else float(le)
+    return others, name, bound
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render():
+    """Метрики в текстовом формате Prometheus."""
+    values = samples()
+    hits = sum(
+        value for (name, labels), value in values.items()
+        if name == 'yatube_cache_requests_total'
+        and ['result', 'hit'] in json.loads(labels))
+    total = sum(
+        value for (name, _), value in values.items()
+        if name == 'yatube_cache_requests_total')
+    if total:
+        values['yatube_cache_hit_ratio', _labels()] = hits / total
+    lines = []
+    for metric, (kind, help_text) in METRICS.items():
+        family = [
+            sample for sample in values.items()
+            if sample[0][0] == metric
+            or sample[0][0] in (
+                f'{metric}_bucket', f'{metric}_sum', f'{metric}_count')
+        ]
+        if not family:
+            continue
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for (name, labels), value in sorted(family, key=_sort_key):
+            lines.append(
+                f'{name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
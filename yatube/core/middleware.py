@@ -0,0 +1,71 @@
+import json
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+from . import instrumentation, metrics
+
+logger = logging.getLogger('yatube.requests')
+
+
+def url_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # Ответ из кеша страниц отдаётся до разрешения URL.
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+    return match.view_name
+
+
+class RequestStatsMiddleware:
+    """Число и время SQL-запросов, повторы, время шаблонов и попадания
+    в кеш для каждого запроса.
+
+    Запись запроса уходит в лог yatube.requests одной строкой JSON
+    и добавляется в сводку по URL name (core.instrumentation.summary)
+    и в гистограммы /metrics (core.metrics).
+    Если один SQL выполнился REQUEST_STATS_REPEAT_THRESHOLD раз и больше,
+    запись пишется с уровнем WARNING. Стоит первым в MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_STATS:
+            return self.get_response(request)
+        stats, token = instrumentation.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(
+                        instrumentation.query_recorder))
+                response = self.get_response(request)
+        finally:
+            instrumentation.finish(token)
+        name = url_name(request) or 'unresolved'
+        record = stats.as_dict()
+        instrumentation.add_to_aggregate(name, record)
+        metrics.observe_request(name, response.status_code, record)
+        self.log(request, response, name, record)
+        return response
+
+    def log(self, request, response, name, record):
+        repeated = (
+            record['most_repeated_count']
+            >= settings.REQUEST_STATS_REPEAT_THRESHOLD)
+        logger.log(
+            logging.WARNING if repeated else logging.INFO,
+            json.dumps({
+                'url_name': name,
+                'path': request.path,
+                'method': request.method,
+                'status': response.status_code,
+                **record,
+            }, ensure_ascii=False),
+        )
@@ -0,0 +1,45 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class Connections:
+    """Соединения с файлом SQLite, общим для процессов: кеш и метрики.
+
+    Соединение своё у каждого потока и у каждого процесса после fork;
+    при смене пути (override_settings в тестах) открывается новое.
+    Файл работает в режиме WAL, схема создаётся при подключении.
+    """
+
+    def __init__(self, schema, pragmas=()):
+        self.schema = schema
+        self.pragmas = pragmas
+        self._local = threading.local()
+
+    def get(self, path):
+        local = self._local
+        db = getattr(local, 'db', None)
+        if db is None or local.pid != os.getpid() or local.path != path:
+            db = sqlite3.connect(
+                path, timeout=30, isolation_level=None,
+                check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            for pragma in self.pragmas:
+                db.execute(f'PRAGMA {pragma}')
+            db.executescript(self.schema)
+            local.db, local.pid, local.path = db, os.getpid(), path
+        return db
+
+
+@contextmanager
+def immediate(db):
+    """Транзакция под блокировкой записи, взятой сразу (BEGIN IMMEDIATE)."""
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        yield db
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    db.execute('COMMIT')
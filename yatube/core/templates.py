@@ -0,0 +1,27 @@
+from django.template.backends.django import DjangoTemplates
+
+from .instrumentation import timing_template
+
+
+class InstrumentedTemplate:
+    """Обёртка шаблона, которая засекает время render()."""
+
+    def __init__(self, template):
+        self._wrapped = template
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def render(self, context=None, request=None):
+        with timing_template():
+            return self._wrapped.render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, сообщающий время отрисовки в RequestStatsMiddleware."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
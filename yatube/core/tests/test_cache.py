@@ -0,0 +1,217 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import SimpleTestCase, override_settings
+
+from ..cache.sqlite import SQLiteCache
+from ..cache.stampede import LOCK_KEY, Entry, get_or_set
+from ..cache.tiered import TieredCache, key_prefix
+
+
+def make_cache(path, **options):
+    return SQLiteCache(path, {'OPTIONS': options})
+
+
+def increment(path, times):
+    cache = make_cache(path)
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = make_cache(self.path, MAX_ENTRIES=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_basic_operations(self):
+        """Значения любых типов сохраняются, читаются и удаляются."""
+        self.cache.set('dict', {'a': [1, 2]})
+        self.cache.set('flag', True)
+        self.assertEqual(self.cache.get('dict'), {'a': [1, 2]})
+        self.assertIs(self.cache.get('flag'), True)
+        self.assertEqual(
+            self.cache.get_many(['dict', 'missing']), {'dict': {'a': [1, 2]}})
+        self.assertTrue(self.cache.delete('dict'))
+        self.assertIsNone(self.cache.get('dict'))
+        self.cache.set('gone', 1, timeout=0)
+        self.assertFalse(self.cache.has_key('gone'))
+
+    def test_add_and_incr(self):
+        """add() не перезаписывает живой ключ, incr() требует ключа."""
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertEqual(self.cache.incr('key', 5), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_shared_between_instances(self):
+        """Запись одного экземпляра видна другому на том же файле."""
+        self.cache.set('shared', 'value')
+        self.assertEqual(make_cache(self.path).get('shared'), 'value')
+
+    def test_lru_cull(self):
+        """При переполнении удаляются давно не читанные записи."""
+        for index in range(10):
+            self.cache.set(f'key{index}', index)
+        time.sleep(1.1)
+        self.cache.get('key0')
+        self.cache.set('key10', 10)
+        self.assertEqual(self.cache.get('key0'), 0)
+        self.assertIsNone(self.cache.get('key1'))
+        stats = self.cache.stats()
+        self.assertEqual(stats['culls'], 1)
+        self.assertLessEqual(stats['entries'], 10)
+        self.assertEqual(stats['entries'], 11 - stats['evicted'])
+
+    def test_size_limit(self):
+        """Суммарный размер значений не превышает MAX_SIZE."""
+        cache = make_cache(self.path, MAX_SIZE=1000)
+        for index in range(20):
+            cache.set(f'blob{index}', b'x' * 100)
+        self.assertLessEqual(cache.stats()['bytes'], 1000)
+
+    def test_incr_is_atomic_across_processes(self):
+        """Параллельные incr() из разных процессов не теряются."""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('spawn')
+        workers = [
+            context.Process(target=increment, args=(self.path, 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiered-test',
+    },
+})
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        # Два экземпляра на одном общем кеше ведут себя как два процесса.
+        self.first, self.second = [
+            TieredCache('', {'OPTIONS': {
+                'BACKEND': 'shared',
+                'LOCAL_MAX_ENTRIES': 3,
+                'STAMP_INTERVAL': 0.2,
+            }})
+            for _ in range(2)
+        ]
+        self.first.clear()
+
+    def test_key_prefix(self):
+        """Префикс — часть ключа до двоеточия или имя фрагмента."""
+        self.assertEqual(key_prefix('feed_version:index'), 'feed_version')
+        self.assertEqual(
+            key_prefix('template.cache.index_page.abc'),
+            'template.cache.index_page')
+
+    def test_repeated_reads_served_locally(self):
+        """Повторное чтение не доходит до общего кеша."""
+        self.first.set('feed:1', 'value')
+        self.second.get('feed:1')
+        self.second.get('feed:1')
+        self.assertEqual(self.second.stats()['feed'], {
+            'local_misses': 1,
+            'shared_hits': 1,
+            'local_hits': 1,
+        })
+
+    def test_writes_invalidate_other_processes(self):
+        """Запись в одном процессе видна другому после сверки штампа."""
+        self.first.set('feed:1', 'old')
+        self.assertEqual(self.second.get('feed:1'), 'old')
+        self.first.set('feed:1', 'new')
+        self.assertEqual(self.first.get('feed:1'), 'new')
+        time.sleep(0.25)
+        self.assertEqual(self.second.get('feed:1'), 'new')
+        self.first.delete('feed:1')
+        time.sleep(0.25)
+        self.assertIsNone(self.second.get('feed:1'))
+
+    def test_local_tier_is_bounded(self):
+        """Память процесса держит не больше LOCAL_MAX_ENTRIES записей."""
+        for index in range(5):
+            self.first.set(f'item:{index}', index)
+        self.assertEqual(len(self.first._local), 3)
+        self.assertEqual(self.first.get('item:0'), 0)
+        self.assertEqual(self.first.incr('item:0'), 1)
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+
+@override_settings(CACHE_LOCK_WAIT=0.1)
+class StampedeTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.compute = Counter()
+
+    def expire(self, key):
+        entry = cache.get(key)
+        cache.set(key, entry._replace(expires=time.time() - 1))
+
+    def test_value_computed_once(self):
+        """Пока значение свежее, оно не пересчитывается."""
+        self.assertEqual(get_or_set('key', self.compute, 60), 1)
+        self.assertEqual(get_or_set('key', self.compute, 60), 1)
+        self.assertEqual(self.compute.calls, 1)
+
+    def test_expired_value_recomputed_by_lock_holder(self):
+        """Устаревшее значение пересчитывает процесс с блокировкой."""
+        get_or_set('key', self.compute, 60)
+        self.expire('key')
+        self.assertEqual(get_or_set('key', self.compute, 60), 2)
+        self.assertFalse(cache.has_key(LOCK_KEY.format('key')))
+
+    def test_stale_value_served_while_locked(self):
+        """Пока другой процесс пересчитывает, отдаётся старое значение."""
+        get_or_set('key', self.compute, 60)
+        self.expire('key')
+        cache.add(LOCK_KEY.format('key'), 1)
+        self.assertEqual(get_or_set('key', self.compute, 60), 1)
+        self.assertEqual(self.compute.calls, 1)
+
+    def test_missing_value_computed_after_wait(self):
+        """Без старого значения процесс ждёт и считает сам."""
+        cache.add(LOCK_KEY.format('key'), 1)
+        self.assertEqual(get_or_set('key', self.compute, 60), 1)
+        self.assertFalse(cache.has_key('key'))
+
+    def test_early_recompute_near_expiry(self):
+        """Долгий расчёт перед истечением срока запускается заранее."""
+        cache.set('key', Entry('old', 100, time.time() + 1))
+        self.assertEqual(get_or_set('key', self.compute, 60, beta=100), 1)
+
+    def test_template_tag(self):
+        """{% load stampede %} кеширует фрагмент как {% cache %}."""
+        template = Template(
+            '{% load stampede %}'
+            '{% cache 60 fragment name %}{{ compute }}{% endcache %}')
+        for name, expected in (('a', '1'), ('a', '1'), ('b', '2')):
+            with self.subTest(name=name):
+                self.assertEqual(template.render(Context({
+                    'compute': self.compute, 'name': name})), expected)
@@ -0,0 +1,87 @@
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from posts.models import Post
+
+from .. import instrumentation
+from ..templates import InstrumentedTemplate
+
+User = get_user_model()
+
+
+@override_settings(REQUEST_STATS=True)
+class RequestStatsMiddlewareTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        Post.objects.create(text='Пост', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        instrumentation.reset()
+
+    def test_request_logged_and_aggregated(self):
+        """Запрос пишется в лог JSON и попадает в сводку по URL name."""
+        with self.assertLogs('yatube.requests', 'INFO') as logs:
+            self.client.get('/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['url_name'], 'posts:index')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertEqual(record['cache_misses'], 1)
+        summary = instrumentation.summary('posts:index')['posts:index']
+        self.assertEqual(summary['requests'], 1)
+        self.assertEqual(summary['queries'], record['queries'])
+
+    def test_cache_hits_counted(self):
+        """Повторный запрос берёт фрагмент ленты из кеша."""
+        with self.assertLogs('yatube.requests', 'INFO'):
+            self.client.get('/')
+            self.client.get('/')
+        summary = instrumentation.summary('posts:index')['posts:index']
+        self.assertEqual(summary['cache_hits'], 1)
+        self.assertEqual(summary['cache_hit_ratio'], 0.5)
+
+    def test_stats_view_for_staff(self):
+        """Сводка доступна сотрудникам в JSON."""
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        with self.assertLogs('yatube.requests', 'INFO'):
+            self.client.get('/')
+            response = self.client.get('/stats/requests/')
+        self.assertEqual(response.json()['posts:index']['requests'], 1)
+
+    def test_repeated_queries_detected(self):
+        """Повторы одного SQL с теми же и разными параметрами считаются."""
+        stats, token = instrumentation.start()
+        try:
+            with connection.execute_wrapper(instrumentation.query_recorder):
+                for _ in range(2):
+                    list(User.objects.filter(pk=self.user.pk))
+                list(User.objects.filter(pk=0))
+        finally:
+            instrumentation.finish(token)
+        self.assertEqual(stats.queries, 3)
+        self.assertEqual(stats.duplicate_queries, 1)
+        self.assertEqual(stats.most_repeated()[1], 3)
+
+    def test_nested_templates_timed_once(self):
+        """Шаблон, отрисованный внутри другого, не удваивает template_ms."""
+        inner = InstrumentedTemplate(mock.Mock(**{'render.return_value': ''}))
+        outer = InstrumentedTemplate(mock.Mock(**{
+            'render.side_effect': lambda *args: inner.render()}))
+        stats, token = instrumentation.start()
+        try:
+            with mock.patch('time.perf_counter', side_effect=[1.0, 4.0]):
+                outer.render()
+        finally:
+            instrumentation.finish(token)
+        self.assertEqual(stats.template_time, 3.0)
+        self.assertEqual(stats.template_depth, 0)
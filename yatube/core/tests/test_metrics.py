@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from .. import metrics
+
+
+def observe_in_process(path, times):
+    with override_settings(METRICS_PATH=path):
+        for _ in range(times):
+            metrics.observe('yatube_thumbnail_generation_seconds', 0.2)
+        metrics.flush()
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'metrics.sqlite3')
+        settings_override = override_settings(
+            METRICS_PATH=self.path, REQUEST_STATS=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        metrics.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_request_histograms(self):
+        """Запрос попадает в гистограммы времени и числа SQL по URL name."""
+        self.client.get('/')
+        self.client.get('/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram', body)
+        self.assertIn(
+            'yatube_request_duration_seconds_count'
+            '{status="200",url_name="posts:index"} 2', body)
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket'
+            '{le="+Inf",status="200",url_name="posts:index"} 2', body)
+        self.assertIn(
+            'yatube_db_queries_per_request_count'
+            '{url_name="posts:index"} 2', body)
+        self.assertIn('yatube_cache_hit_ratio 0.5', body)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_metrics_closed_to_strangers(self):
+        """/metrics отдаётся сборщику из списка и сотрудникам."""
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, 200)
+        staff = get_user_model().objects.create_user(
+            username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_buckets_are_cumulative(self):
+        metrics.observe('yatube_db_time_seconds', 0.03, url_name='x')
+        body = metrics.render()
+        self.assertIn(
+            'yatube_db_time_seconds_bucket{le="0.025",url_name="x"} 0', body)
+        self.assertIn(
+            'yatube_db_time_seconds_bucket{le="0.05",url_name="x"} 1', body)
+        self.assertIn(
+            'yatube_db_time_seconds_bucket{le="10.0",url_name="x"} 1', body)
+        self.assertLess(
+            body.index('le="0.05"'), body.index('le="+Inf"'))
+
+    def test_processes_are_aggregated(self):
+        """Значения из разных процессов складываются в общем файле."""
+        context = multiprocessing.get_context('spawn')
+        workers = [
+            context.Process(target=observe_in_process, args=(self.path, 5))
+            for _ in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertIn(
+            'yatube_thumbnail_generation_seconds_count 15', metrics.render())
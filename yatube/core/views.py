@@ -1,5 +1,12 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
 
+from . import instrumentation
+from . import metrics as metrics_store
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -15,3 +22,18 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+@staff_member_required
+def request_stats(request):
+    return JsonResponse(
+        instrumentation.summary(request.GET.get('url_name')))
+
+
+def metrics(request):
+    if not (request.user.is_staff
+            or request.META.get('REMOTE_ADDR')
+            in settings.METRICS_ALLOWED_IPS):
+        raise PermissionDenied
+    return HttpResponse(
+        metrics_store.render(), content_type=metrics_store.CONTENT_TYPE)
@@ -0,0 +1,156 @@
+import gc
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Group, Post
+
+User = get_user_model()
+
+# Объёмы баз для manage.py benchmark, параметры как у manage.py seed.
+SIZES = {
+    'small': dict(
+        users=200, posts=2000, comments=4000, follows=2000, groups=5),
+    'medium': dict(
+        users=2000, posts=50000, comments=100000, follows=40000, groups=20),
+    'large': dict(
+        users=20000, posts=500000, comments=1000000, follows=400000,
+        groups=50),
+}
+
+VIEWS = (
+    'index', 'group_posts', 'profile', 'post_detail', 'follow_index',
+    'post_create', 'add_comment',
+)
+
+
+def percentile(values, q):
+    """Перцентиль q (0–100) по методу ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+class Targets:
+    """Самые тяжёлые объекты базы: крупная группа, самый плодовитый
+    автор, самый обсуждаемый пост и читатель с наибольшим числом
+    подписок."""
+
+    def __init__(self):
+        self.group = Group.objects.order_by('-posts_count').first()
+        self.author = User.objects.order_by('-counters__posts_count').first()
+        self.post = Post.objects.order_by('-comments_count').first()
+        self.reader = User.objects.annotate(
+            follows=Count('follower')).order_by('-follows').first()
+
+    def request(self, view):
+        """Метод, адрес, данные формы и пользователь для view."""
+        if view == 'index':
+            return 'get', reverse('posts:index'), None, None
+        if view == 'group_posts':
+            return 'get', reverse(
+                'posts:group_list', args=(self.group.slug,)), None, None
+        if view == 'profile':
+            return 'get', reverse(
+                'posts:profile', args=(self.author.username,)), None, None
+        if view == 'post_detail':
+            return 'get', reverse(
+                'posts:post_detail', args=(self.post.pk,)), None, None
+        if view == 'follow_index':
+            return 'get', reverse('posts:follow_index'), None, self.reader
+        if view == 'post_create':
+            return 'post', reverse('posts:create'), {
+                'text': 'Пост из бенчмарка', 'group': self.group.pk,
+            }, self.reader
+        if view == 'add_comment':
+            return 'post', reverse(
+                'posts:add_comment', args=(self.post.pk,)), {
+                'text': 'Комментарий из бенчмарка',
+            }, self.reader
+        raise ValueError(f'Неизвестный view: {view}')
+
+
+def measure(view, targets, iterations=50, warmup=5, cold=False,
+            memory_iterations=5):
+    """Прогнать view через тестовый клиент со всеми middleware.
+
+    Время и число запросов снимаются без tracemalloc, пиковая память —
+    отдельными прогонами: трассировка сильно замедляет код. Записи
+    откатываются, чтобы база оставалась одинаковой между запусками.
+    """
+    method, url, data, user = targets.request(view)
+    client = Client()
+    if user is not None:
+        client.force_login(user)
+    send = getattr(client, method)
+    cache.clear()
+    timings, queries = [], []
+    with transaction.atomic():
+        for index in range(warmup + iterations):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = send(url, data)
+                elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                raise RuntimeError(
+                    f'{view}: ответ {response.status_code} на {url}')
+            if index >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(captured))
+        peak = 0
+        gc.collect()
+        tracemalloc.start()
+        try:
+            for _ in range(memory_iterations):
+                if cold:
+                    cache.clear()
+                tracemalloc.reset_peak()
+                send(url, data)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+        transaction.set_rollback(True)
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': max(queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'iterations': iterations,
+    }
+
+
+def run(views=VIEWS, **options):
+    targets = Targets()
+    return {view: measure(view, targets, **options) for view in views}
+
+
+def compare(results, baseline, threshold):
+    """Регрессии results относительно baseline: p95 медленнее больше чем
+    на threshold (доля) или больше SQL-запросов на view."""
+    regressions = []
+    for size, views in results.items():
+        for view, current in views.items():
+            previous = baseline.get(size, {}).get(view)
+            if previous is None:
+                continue
+            limit = previous['p95_ms'] * (1 + threshold)
+            if current['p95_ms'] > limit:
+                regressions.append(
+                    f'{size}/{view}: p95 {current["p95_ms"]} мс, '
+                    f'было {previous["p95_ms"]} мс')
+            if current['queries'] > previous['queries']:
+                regressions.append(
+                    f'{size}/{view}: {current["queries"]} SQL-запросов, '
+                    f'было {previous["queries"]}')
+    return regressions
@@ -0,0 +1,80 @@
+import posixpath
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+from .models import ImageBlob, Post
+
+
+def image_storage():
+    return Post._meta.get_field('image').storage
+
+
+def add_ref(name):
+    if not name:
+        return
+    updated = ImageBlob.objects.filter(name=name).update(refs=F('refs') + 1)
+    if not updated:
+        # Строки ещё нет: считаем ссылки целиком, новая уже в базе.
+        ImageBlob.objects.get_or_create(
+            name=name, defaults={'refs': count_refs(name)})
+
+
+def release(name):
+    if name:
+        ImageBlob.objects.filter(name=name).update(
+            refs=Greatest(F('refs') - 1, 0))
+
+
+def count_refs(name):
+    return Post.objects.filter(image=name).count()
+
+
+def stored_files(storage, directory):
+    """Пути всех файлов каталога хранилища, включая подкаталоги."""
+    directories, files = storage.listdir(directory)
+    for filename in files:
+        yield posixpath.join(directory, filename)
+    for subdirectory in directories:
+        yield from stored_files(
+            storage, posixpath.join(directory, subdirectory))
+
+
+def collect(grace=None, dry_run=False):
+    """Удалить файлы картинок, на которые не ссылается ни один пост.
+
+    Кандидаты — строки ImageBlob без ссылок и файлы, которых нет
+    в ImageBlob (загрузки, пост для которых так и не сохранился).
+    Перед удалением ссылки пересчитываются по таблице постов, а файлы
+    моложе grace секунд не трогаются. Возвращает список удалённых имён.
+    """
+    if grace is None:
+        grace = settings.IMAGE_GC_GRACE
+    storage = image_storage()
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    candidates = set(
+        ImageBlob.objects.filter(refs=0).values_list('name', flat=True))
+    upload_to = Post._meta.get_field('image').upload_to
+    if storage.exists(upload_to):
+        known = set(ImageBlob.objects.values_list('name', flat=True))
+        candidates.update(
+            name for name in stored_files(storage, upload_to.rstrip('/'))
+            if name not in known)
+    removed = []
+    for name in sorted(candidates):
+        refs = count_refs(name)
+        if refs:
+            ImageBlob.objects.filter(name=name).update(refs=refs)
+            continue
+        if storage.exists(name) and storage.get_modified_time(name) > cutoff:
+            continue
+        if not dry_run:
+            delete(ImageFile(name, storage))
+            ImageBlob.objects.filter(name=name, refs=0).delete()
+        removed.append(name)
+    return removed
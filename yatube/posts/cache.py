@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import time
+import urllib.request
+from urllib.parse import quote
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.views.decorators.http import condition
+
+from .models import Group
+
+VERSION_KEY = 'feed_version:{}'
+MODIFIED_KEY = 'feed_modified:{}'
+
+logger = logging.getLogger(__name__)
+
+
+def get_version(*scopes):
+    """Вернуть составную версию кеша для набора областей ленты."""
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), None)
+            versions[key] = cache.get(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def bump_version(*scopes):
+    """Инвалидировать фрагменты областей, увеличив их версию."""
+    for scope in scopes:
+        key = VERSION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), None)
+        cache.set(MODIFIED_KEY.format(scope), time.time(), None)
+
+
+def get_modified(*scopes):
+    """Время последнего изменения областей ленты.
+
+    Если отметки нет (её вытеснили из кеша), считаем, что область
+    изменилась только что.
+    """
+    keys = [MODIFIED_KEY.format(scope) for scope in scopes]
+    stamps = cache.get_many(keys)
+    for key in keys:
+        if key not in stamps:
+            cache.add(key, time.time(), None)
+            stamps[key] = cache.get(key) or time.time()
+    return datetime.fromtimestamp(max(stamps.values()), tz=timezone.utc)
+
+
+def post_scopes(author_id, *group_ids):
+    scopes = ['index', f'author:{author_id}']
+    scopes.extend(f'group:{group_id}' for group_id in group_ids if group_id)
+    return scopes
+
+
+def feed_cache_context(*scopes):
+    return {
+        'cache_timeout': settings.FEED_CACHE_TIMEOUT,
+        'cache_version': get_version(*scopes),
+    }
+
+
+def feed_condition(get_scopes):
+    """Условный GET для страницы ленты: 304, если она не менялась.
+
+    get_scopes получает аргументы view и возвращает области ленты
+    страницы или None, если объекта нет. ETag строится из их версий
+    и пользователя, ведь залогиненным выводятся кнопки подписки
+    и ссылки на редактирование. Last-Modified отдаётся только
+    анонимам: по одному времени нельзя отличить вход в аккаунт.
+    """
+    def scopes_for(request, args, kwargs):
+        if not hasattr(request, '_feed_scopes'):
+            request._feed_scopes = get_scopes(*args, **kwargs)
+        return request._feed_scopes
+
+    def etag(request, *args, **kwargs):
+        scopes = scopes_for(request, args, kwargs)
+        if scopes is None:
+            return None
+        viewer = request.user.pk if request.user.is_authenticated else ''
+        raw = f'{get_version(*scopes)}:{viewer}'
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        scopes = scopes_for(request, args, kwargs)
+        if scopes is None or request.user.is_authenticated:
+            return None
+        return get_modified(*scopes)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def add_surrogate_keys(request, *keys):
+    """Пометить страницу ключами для кеша страниц и обратного прокси."""
+    if not hasattr(request, 'surrogate_keys'):
+        request.surrogate_keys = set()
+    request.surrogate_keys.update(keys)
+
+
+def group_surrogate_key(slug):
+    # Ключ идёт в заголовок через пробел и в ключи кеша: только ASCII.
+    return f'group-{quote(slug, safe="")}'
+
+
+def group_page_keys(*group_ids):
+    slugs = Group.objects.filter(
+        id__in=[group_id for group_id in group_ids if group_id],
+    ).values_list('slug', flat=True)
+    return [group_surrogate_key(slug) for slug in slugs]
+
+
+def feed_page_keys(post, *group_ids):
+    """Ключи страниц, где виден пост. Ленты помечены только своими
+    ключами, без ключей постов страницы: иначе view читал бы выборку
+    даже тогда, когда страница собрана из фрагментов {% cache %}."""
+    return [
+        f'post-{post.pk}', 'index', f'author-{post.author_id}',
+        *group_page_keys(post.group_id, *group_ids),
+    ]
+
+
+def page_version(keys):
+    return get_version(*(f'page:{key}' for key in sorted(keys)))
+
+
+def purge_pages(*keys):
+    """Сбросить закешированные страницы с любым из ключей.
+
+    Версии увеличиваются сразу и ещё раз после коммита: иначе страница,
+    собранная до коммита, снова попала бы в кеш со старыми данными.
+    Если задан PAGE_CACHE_PURGE_URL, после коммита те же ключи уходят
+    обратному прокси запросом PURGE с заголовком Surrogate-Key.
+    """
+    keys = [key for key in keys if key]
+    if not keys:
+        return
+    scopes = [f'page:{key}' for key in keys]
+    bump_version(*scopes)
+
+    def after_commit():
+        bump_version(*scopes)
+        if settings.PAGE_CACHE_PURGE_URL:
+            _purge_proxy(keys)
+
+    transaction.on_commit(after_commit)
+
+
+def _purge_proxy(keys):
+    request = urllib.request.Request(
+        settings.PAGE_CACHE_PURGE_URL,
+        method='PURGE',
+        headers={'Surrogate-Key': ' '.join(keys)},
+    )
+    try:
+        urllib.request.urlopen(request, timeout=2).close()
+    except OSError:
+        logger.exception('Не удалось сбросить кеш прокси: %s', keys)
+
+
+def _initial_version():
+    # Версия от времени не повторяет старую, если ключ вытеснили из кеша.
+    return int(time.time() * 1000)
@@ -0,0 +1,38 @@
+"""Кеш HTML карточек постов в лентах.
+
+Карточка зависит только от поста, его автора и группы, поэтому ключ —
+шаблон карточки, id поста и время его изменения (updated): правка поста
+даёт новый ключ, а старая карточка просто истекает. Всё остальное, что
+меняет карточку, — имя автора, название группы, готовые миниатюры —
+сдвигает updated у затронутых постов через touch_posts().
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils import timezone
+
+CARD_KEY = 'post-card:{}:{}:{}'
+
+
+def card_key(template_name, post):
+    return CARD_KEY.format(template_name, post.pk, post.updated.timestamp())
+
+
+def render_cards(posts, template_name):
+    """HTML карточек в порядке posts: готовые приходят одним get_many,
+    недостающие рендерятся и кладутся одним set_many."""
+    keys = [card_key(template_name, post) for post in posts]
+    cards = cache.get_many(keys)
+    missing = {}
+    for key, post in zip(keys, posts):
+        if key not in cards:
+            cards[key] = missing[key] = get_template(template_name).render(
+                {'post': post})
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_CACHE_TIMEOUT)
+    return [cards[key] for key in keys]
+
+
+def touch_posts(queryset):
+    """Сбросить карточки постов queryset, сдвинув их updated."""
+    return queryset.update(updated=timezone.now())
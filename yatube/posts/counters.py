@@ -0,0 +1,75 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Group, Post, UserCounter
+
+User = get_user_model()
+
+
+def _shift(field, delta):
+    # Счётчик не уходит ниже нуля, даже если успел разойтись с данными.
+    return Greatest(F(field) + delta, 0)
+
+
+def change_post_counter(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=_shift('comments_count', delta))
+
+
+def change_group_counter(group_id, delta):
+    if group_id:
+        Group.objects.filter(pk=group_id).update(
+            posts_count=_shift('posts_count', delta))
+
+
+def change_user_counter(user_id, field, delta):
+    updated = UserCounter.objects.filter(user_id=user_id).update(
+        **{field: _shift(field, delta)})
+    if not updated and delta > 0:
+        # Строки ещё нет: считаем её целиком, изменение уже в базе.
+        UserCounter.objects.get_or_create(
+            user_id=user_id, defaults=count_user(user_id))
+
+
+def count_user(user_id):
+    return {
+        'posts_count': Post.objects.filter(author_id=user_id).count(),
+        'followers_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def get_user_counter(user):
+    try:
+        return UserCounter.objects.get(user_id=user.id)
+    except UserCounter.DoesNotExist:
+        # Считаем только для новой строки: defaults вычисляются заранее.
+        counter, _ = UserCounter.objects.get_or_create(
+            user_id=user.id, defaults=count_user(user.id))
+        return counter
+
+
+def _count(queryset, field, outer='pk'):
+    """Подзапрос числа строк queryset, связанных с внешней строкой."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef(outer)}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total')
+    ), Value(0))
+
+
+def reconcile():
+    """Пересчитать все счётчики одним UPDATE на таблицу."""
+    Post.objects.update(comments_count=_count(Comment.objects, 'post'))
+    Group.objects.update(posts_count=_count(Post.objects, 'group'))
+    UserCounter.objects.bulk_create(
+        [UserCounter(user_id=user_id) for user_id in
+         User.objects.filter(counters__isnull=True)
+         .values_list('id', flat=True)],
+        ignore_conflicts=True,
+    )
+    UserCounter.objects.update(
+        posts_count=_count(Post.objects, 'author', 'user_id'),
+        followers_count=_count(Follow.objects, 'author', 'user_id'),
+        following_count=_count(Follow.objects, 'user', 'user_id'),
+    )
@@ -1,6 +1,7 @@
 from django import forms
 
-from .models import Comment, Post
+from .images import normalize_image
+from .models import Comment, Group, Post
 
 
 class PostForm(forms.ModelForm):
@@ -12,8 +13,34 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой будет относиться пост',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if 'image' not in self.changed_data:
+            return image
+        if not image:
+            self.instance.image_width = None
+            self.instance.image_height = None
+            self.instance.image_size = None
+            return image
+        normalized = normalize_image(image)
+        self.instance.image_width = normalized.width
+        self.instance.image_height = normalized.height
+        self.instance.image_size = normalized.size
+        return normalized
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ['text']
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label='Что ищем', max_length=200)
+    group = forms.ModelChoiceField(
+        queryset=Group.objects.all(),
+        to_field_name='slug',
+        required=False,
+        label='Группа')
+    author = forms.CharField(
+        label='Автор', max_length=150, required=False)
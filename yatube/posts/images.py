@@ -0,0 +1,74 @@
+import os
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+EXTENSIONS = {
+    'WEBP': 'webp',
+    'JPEG': 'jpg',
+}
+
+
+def output_format():
+    """Формат хранения: WebP, если Pillow собран с ним, иначе JPEG."""
+    if settings.IMAGE_FORMAT == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return settings.IMAGE_FORMAT
+
+
+def normalize_image(uploaded):
+    """Привести загруженную картинку к виду, в котором её храним.
+
+    Отсекает слишком большие файлы и «бомбы» до полного декодирования,
+    поворачивает по EXIF, уменьшает до IMAGE_MAX_SIZE и пересохраняет
+    без метаданных. Возвращает ContentFile с размерами в width и height.
+    """
+    if uploaded.size > settings.IMAGE_MAX_UPLOAD_SIZE:
+        raise ValidationError('Файл слишком большой.')
+    uploaded.seek(0)
+    # Декодирование, уменьшение и сохранение — в одном try: обрезанный
+    # файл открывается, а падает только при чтении пикселей.
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        try:
+            image = Image.open(uploaded)
+            if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+                raise ValidationError('Слишком большое разрешение.')
+            # JPEG сразу декодируется в уменьшенном масштабе.
+            image.draft('RGB', settings.IMAGE_MAX_SIZE)
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(settings.IMAGE_MAX_SIZE, Image.LANCZOS)
+            image_format = output_format()
+            image = _convert_mode(image, image_format)
+            buffer = BytesIO()
+            image.save(
+                buffer, image_format, quality=settings.IMAGE_QUALITY,
+                optimize=True)
+        except (Image.DecompressionBombError,
+                Image.DecompressionBombWarning):
+            raise ValidationError('Слишком большое разрешение.')
+        except (OSError, ValueError, SyntaxError):
+            raise ValidationError('Картинка повреждена или обрезана.')
+    stem = os.path.splitext(os.path.basename(uploaded.name))[0]
+    normalized = ContentFile(
+        buffer.getvalue(), name=f'{stem}.{EXTENSIONS[image_format]}')
+    normalized.width, normalized.height = image.size
+    return normalized
+
+
+def _convert_mode(image, image_format):
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha and image_format == 'WEBP':
+        return image.convert('RGBA')
+    if has_alpha:
+        # JPEG без прозрачности: кладём картинку на белый фон.
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB')
@@ -0,0 +1,103 @@
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core import metrics
+
+from .models import ImageJob
+
+HANDLERS = {
+    'thumbnails': 'posts.thumbnails.generate_thumbnails',
+}
+
+
+def enqueue(post, kind):
+    """Поставить картинку поста в очередь; выполнит её image_worker."""
+    return ImageJob.objects.create(post=post, kind=kind)
+
+
+def claim(limit):
+    """Забрать до limit готовых к запуску заданий и вернуть их id."""
+    candidates = list(ImageJob.objects.filter(
+        status=ImageJob.PENDING, run_after__lte=timezone.now(),
+    ).values_list('id', flat=True)[:limit])
+    claimed = []
+    for job_id in candidates:
+        # Условие по статусу не даёт двум воркерам взять одно задание.
+        taken = ImageJob.objects.filter(
+            id=job_id, status=ImageJob.PENDING,
+        ).update(
+            status=ImageJob.RUNNING,
+            attempts=F('attempts') + 1,
+            updated=timezone.now(),
+        )
+        if taken:
+            claimed.append(job_id)
+    return claimed
+
+
+def run_job(job_id):
+    """Выполнить задание; вызывается в процессе пула image_worker."""
+    job = ImageJob.objects.select_related('post').get(id=job_id)
+    try:
+        import_string(HANDLERS[job.kind])(job.post)
+    except Exception:
+        return retry_later(job_id, traceback.format_exc())
+    finally:
+        # Процессы пула завершаются без atexit, поэтому пишем сразу.
+        metrics.flush()
+    ImageJob.objects.filter(id=job_id).update(
+        status=ImageJob.DONE, last_error='', updated=timezone.now())
+    return ImageJob.DONE
+
+
+def retry_later(job_id, error):
+    """Отложить задание с экспоненциальной задержкой.
+
+    Задание, упавшее IMAGE_JOB_MAX_ATTEMPTS раз, считается отравленным и
+    больше не запускается.
+    """
+    job = ImageJob.objects.get(id=job_id)
+    if job.attempts >= settings.IMAGE_JOB_MAX_ATTEMPTS:
+        job.status = ImageJob.FAILED
+    else:
+        job.status = ImageJob.PENDING
+        delay = settings.IMAGE_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        job.run_after = timezone.now() + timedelta(seconds=delay)
+    job.last_error = error
+    job.save(update_fields=('status', 'run_after', 'last_error', 'updated'))
+    return job.status
+
+
+def requeue_stale():
+    """Вернуть в очередь задания воркеров, которые умерли на ходу."""
+    stale = timezone.now() - timedelta(seconds=settings.IMAGE_JOB_TIMEOUT)
+    stale_ids = list(ImageJob.objects.filter(
+        status=ImageJob.RUNNING, updated__lt=stale,
+    ).values_list('id', flat=True))
+    for job_id in stale_ids:
+        retry_later(job_id, 'Задание не завершилось вовремя')
+
+
+def queue_status():
+    counts = dict(
+        ImageJob.objects.order_by().values_list('status')
+        .annotate(total=Count('id')))
+    oldest = ImageJob.objects.filter(
+        status=ImageJob.PENDING).aggregate(oldest=Min('created'))['oldest']
+    failed = ImageJob.objects.filter(status=ImageJob.FAILED).order_by(
+        '-updated').values('id', 'post_id', 'kind', 'attempts',
+                           'last_error')[:10]
+    return {
+        'counts': {
+            status: counts.get(status, 0)
+            for status, _ in ImageJob.STATUS_CHOICES
+        },
+        'oldest_pending_seconds': (
+            (timezone.now() - oldest).total_seconds() if oldest else None),
+        'recent_failures': list(failed),
+    }
@@ -0,0 +1,240 @@
+import random
+import time
+from collections import defaultdict, namedtuple
+from io import BytesIO
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from PIL import Image
+
+from .benchmark import percentile
+from .models import Group, Post
+from .seed import PASSWORD
+
+User = get_user_model()
+
+# weight — доля сценария в смеси по умолчанию, login — нужен ли вход.
+Scenario = namedtuple('Scenario', 'weight login')
+
+SCENARIOS = {
+    'index': Scenario(45, False),
+    'group_posts': Scenario(15, False),
+    'profile': Scenario(10, False),
+    'post_detail': Scenario(15, False),
+    'follow_index': Scenario(10, True),
+    'add_comment': Scenario(4, True),
+    'post_create': Scenario(1, True),
+}
+
+# Отметка запроса: секунда от старта, сценарий, время в мс, ошибка.
+Sample = namedtuple('Sample', 'second scenario latency_ms error')
+
+PAGES = 5
+TARGETS = 200
+
+
+def parse_mix(text):
+    """Разобрать смесь вида «index=50,follow_index=10»."""
+    mix = {}
+    for item in filter(None, text.split(',')):
+        name, _, weight = item.partition('=')
+        if name not in SCENARIOS:
+            raise ValueError(f'Неизвестный сценарий: {name}')
+        mix[name] = float(weight)
+    return mix
+
+
+def collect_targets(readers):
+    """Группы, авторы, посты и читатели с подписками для сценариев."""
+    return {
+        'groups': list(Group.objects.order_by('-posts_count').values_list(
+            'slug', 'pk')[:TARGETS]),
+        'authors': list(User.objects.filter(
+            counters__posts_count__gt=0).order_by('?').values_list(
+            'username', flat=True)[:TARGETS]),
+        'posts': list(Post.objects.order_by('?').values_list(
+            'pk', flat=True)[:TARGETS]),
+        'readers': list(User.objects.annotate(
+            follows=Count('follower')).filter(follows__gt=0).order_by(
+            '-follows').values_list('username', flat=True)[:readers]),
+    }
+
+
+def random_image(rng):
+    image = Image.new('RGB', (320, 200), tuple(
+        rng.randrange(256) for _ in range(3)))
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def build_request(scenario, targets, rng):
+    """Метод, путь, данные формы и файлы запроса сценария."""
+    if scenario == 'index':
+        return 'get', reverse('posts:index'), {
+            'page': rng.randint(1, PAGES)}, None
+    if scenario == 'group_posts':
+        slug, _ = rng.choice(targets['groups'])
+        return 'get', reverse('posts:group_list', args=(slug,)), {
+            'page': rng.randint(1, PAGES)}, None
+    if scenario == 'profile':
+        username = rng.choice(targets['authors'])
+        return 'get', reverse('posts:profile', args=(username,)), None, None
+    if scenario == 'post_detail':
+        post_id = rng.choice(targets['posts'])
+        return 'get', reverse(
+            'posts:post_detail', args=(post_id,)), None, None
+    if scenario == 'follow_index':
+        return 'get', reverse('posts:follow_index'), None, None
+    if scenario == 'add_comment':
+        return 'post', reverse(
+            'posts:add_comment', args=(rng.choice(targets['posts']),)), {
+            'text': 'Комментарий нагрузочного теста'}, None
+    if scenario == 'post_create':
+        data = {'text': 'Пост нагрузочного теста'}
+        if targets['groups']:
+            _, data['group'] = rng.choice(targets['groups'])
+        return 'post', reverse('posts:create'), data, {
+            'image': ('load.jpg', random_image(rng))}
+    raise ValueError(f'Неизвестный сценарий: {scenario}')
+
+
+class InProcessDriver:
+    """Запросы к WSGI-приложению в том же процессе через тестовый клиент."""
+
+    def __init__(self, username=None):
+        self.client = Client()
+        if username:
+            self.client.force_login(User.objects.get(username=username))
+
+    def send(self, method, path, data, files):
+        data = dict(data or {})
+        for field, (name, content) in (files or {}).items():
+            data[field] = SimpleUploadedFile(name, content, 'image/jpeg')
+        return getattr(self.client, method)(path, data).status_code
+
+
+class HttpDriver:
+    """Запросы к запущенному серверу; вход по паролю из manage.py seed."""
+
+    def __init__(self, base_url, username=None, password=PASSWORD):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        if username:
+            self.login(username, password)
+
+    def login(self, username, password, attempts=5):
+        # Вход пишет сессию; на SQLite одновременные входы процессов
+        # пула упираются в блокировку базы, поэтому повторяем.
+        url = self.base_url + reverse('users:login')
+        for attempt in range(attempts):
+            self.session.get(url)
+            response = self.session.post(url, data={
+                'username': username,
+                'password': password,
+                'csrfmiddlewaretoken': self.session.cookies.get('csrftoken'),
+            }, headers={'Referer': url}, allow_redirects=False)
+            if response.status_code == 302:
+                return
+            time.sleep(0.5 * (attempt + 1))
+        raise RuntimeError(f'Не удалось войти как {username}')
+
+    def send(self, method, path, data, files):
+        url = self.base_url + path
+        if method == 'get':
+            response = self.session.get(
+                url, params=data, allow_redirects=False)
+        else:
+            data = {
+                **(data or {}),
+                'csrfmiddlewaretoken': self.session.cookies.get('csrftoken'),
+            }
+            files = {
+                field: (name, content, 'image/jpeg')
+                for field, (name, content) in (files or {}).items()
+            }
+            response = self.session.post(
+                url, data=data, files=files, headers={'Referer': url},
+                allow_redirects=False)
+        return response.status_code
+
+
+def make_driver(base_url, username=None):
+    if base_url:
+        return HttpDriver(base_url, username)
+    return InProcessDriver(username)
+
+
+def run_worker(index, mix, targets, started, duration, base_url=None,
+               seed=0, think_time=0.0):
+    """Гонять сценарии по весам mix до конца теста; вызывается в процессе
+    пула. Каждый процесс — один посетитель с анонимной сессией и сессией
+    своего читателя."""
+    rng = random.Random(seed + index)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    reader = targets['readers'][index % len(targets['readers'])] if (
+        targets['readers']) else None
+    anonymous = make_driver(base_url)
+    logged_in = make_driver(base_url, reader) if reader else None
+    samples = []
+    time.sleep(max(0.0, started - time.time()))
+    deadline = started + duration
+    while time.time() < deadline:
+        scenario = rng.choices(names, weights)[0]
+        driver = logged_in if SCENARIOS[scenario].login else anonymous
+        if driver is None:
+            continue
+        began = time.time()
+        try:
+            status = driver.send(*build_request(scenario, targets, rng))
+            error = status >= 400
+        except Exception:
+            error = True
+        finished = time.time()
+        samples.append(Sample(
+            int(began - started), scenario, (finished - began) * 1000, error))
+        if think_time:
+            time.sleep(rng.expovariate(1 / think_time))
+    return samples
+
+
+def summarize(samples, seconds):
+    if not samples:
+        return {'requests': 0, 'rps': 0.0, 'errors': 0.0}
+    latencies = [sample.latency_ms for sample in samples]
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'errors': round(
+            sum(sample.error for sample in samples) / len(samples), 4),
+    }
+
+
+def report(samples, duration, interval):
+    """Итоги теста: по интервалам времени, по сценариям и в целом."""
+    windows = defaultdict(list)
+    scenarios = defaultdict(list)
+    for sample in samples:
+        windows[sample.second // interval * interval].append(sample)
+        scenarios[sample.scenario].append(sample)
+    return {
+        'total': summarize(samples, duration),
+        'scenarios': {
+            name: summarize(scenario_samples, duration)
+            for name, scenario_samples in sorted(scenarios.items())
+        },
+        'timeline': [
+            {'second': second,
+             **summarize(windows[second], min(interval, duration - second))}
+            for second in sorted(windows)
+            if second < duration
+        ],
+    }
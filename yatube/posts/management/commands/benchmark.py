@@ -0,0 +1,125 @@
+import json
+import os
+import platform
+from contextlib import contextmanager
+from datetime import datetime
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts import benchmark
+from posts.models import Post
+from posts.seed import Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет view постов на базах разного объёма: перцентили '
+        'времени, число SQL-запросов и пиковую память.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='small,medium',
+            help='Объёмы баз через запятую: '
+                 + ', '.join(benchmark.SIZES) + '.')
+        parser.add_argument(
+            '--views', default=','.join(benchmark.VIEWS),
+            help='View через запятую.')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кеш перед каждым запросом.')
+        parser.add_argument(
+            '--db-dir', default=os.path.join(settings.BASE_DIR, '.benchmarks'),
+            help='Каталог с наполненными базами; они переиспользуются.')
+        parser.add_argument(
+            '--reseed', action='store_true',
+            help='Наполнить базы заново.')
+        parser.add_argument('--output', help='Сохранить результаты в JSON.')
+        parser.add_argument(
+            '--compare', help='JSON прошлого запуска для сравнения.')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимое замедление p95, доля; по умолчанию 0.2.')
+
+    def handle(self, *args, **options):
+        sizes = options['sizes'].split(',')
+        views = options['views'].split(',')
+        unknown = (set(sizes) - set(benchmark.SIZES)) | (
+            set(views) - set(benchmark.VIEWS))
+        if unknown:
+            raise CommandError(f'Неизвестно: {", ".join(sorted(unknown))}')
+        if connection.vendor != 'sqlite':
+            raise CommandError('Бенчмарк наполняет отдельные базы SQLite.')
+        os.makedirs(options['db_dir'], exist_ok=True)
+        results = {}
+        for size in sizes:
+            path = os.path.join(options['db_dir'], f'{size}.sqlite3')
+            with self.database(path, options['reseed']):
+                if not Post.objects.exists():
+                    self.stdout.write(f'Наполнение базы {size}')
+                    Seeder(log=self.stdout.write).run(
+                        **benchmark.SIZES[size])
+                self.stdout.write(f'Замеры на базе {size}')
+                results[size] = benchmark.run(
+                    views,
+                    iterations=options['iterations'],
+                    warmup=options['warmup'],
+                    cold=options['cold'],
+                )
+            self.report(size, results[size])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({
+                    'meta': self.meta(options),
+                    'results': results,
+                }, output, ensure_ascii=False, indent=2)
+        if options['compare']:
+            with open(options['compare']) as previous:
+                baseline = json.load(previous)['results']
+            regressions = benchmark.compare(
+                results, baseline, options['threshold'])
+            if regressions:
+                raise CommandError(
+                    'Регрессии:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    @contextmanager
+    def database(self, path, reseed):
+        """Переключиться на базу SQLite по пути path на время замеров."""
+        connection.settings_dict['TEST'] = {
+            **connection.settings_dict.get('TEST', {}), 'NAME': path}
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False,
+            keepdb=not reseed)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=True)
+
+    def report(self, size, results):
+        self.stdout.write(
+            f'{size:<8} {"view":<14} {"p50":>9} {"p95":>9} {"p99":>9} '
+            f'{"SQL":>5} {"память, КБ":>11}')
+        for view, row in results.items():
+            self.stdout.write(
+                f'{"":<8} {view:<14} {row["p50_ms"]:>9.2f} '
+                f'{row["p95_ms"]:>9.2f} {row["p99_ms"]:>9.2f} '
+                f'{row["queries"]:>5} {row["peak_memory_kb"]:>11.1f}')
+
+    def meta(self, options):
+        return {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sizes': {
+                size: benchmark.SIZES[size]
+                for size in options['sizes'].split(',')
+            },
+            'iterations': options['iterations'],
+            'cold': options['cold'],
+        }
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры для картинок уже опубликованных постов.'
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').only(
+            'id', 'image', 'image_width', 'author_id', 'group_id')
+        count = failed = 0
+        for post in posts.iterator():
+            # Одна битая картинка не должна останавливать весь проход.
+            try:
+                generate_thumbnails(post)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'Пост {post.pk}: {error}')
+                continue
+            count += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано картинок: {count}'))
+        if failed:
+            self.stdout.write(
+                self.style.WARNING(f'Не удалось обработать: {failed}'))
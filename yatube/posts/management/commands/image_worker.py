@@ -0,0 +1,69 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import jobs, worker
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь картинок постов в пуле процессов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Число процессов пула, по умолчанию по числу ядер.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза в секундах, когда очередь пуста.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Разобрать очередь и выйти.')
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        executor = self.start_pool(workers)
+        try:
+            while True:
+                jobs.requeue_stale()
+                job_ids = jobs.claim(workers * 2)
+                if not job_ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                if not self.run_batch(executor, job_ids):
+                    executor.shutdown(wait=False)
+                    executor = self.start_pool(workers)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown()
+
+    def start_pool(self, workers):
+        # Дочерние процессы не должны делить соединения родителя.
+        connections.close_all()
+        return ProcessPoolExecutor(
+            max_workers=workers, initializer=worker.init_worker)
+
+    def run_batch(self, executor, job_ids):
+        """Выполнить пачку заданий; False, если пул надо пересоздать."""
+        futures = {
+            executor.submit(worker.run_job, job_id): job_id
+            for job_id in job_ids
+        }
+        healthy = True
+        for future in as_completed(futures):
+            job_id = futures[future]
+            try:
+                status = future.result()
+            except BrokenProcessPool:
+                healthy = False
+                status = jobs.retry_later(job_id, 'Процесс обработки упал')
+            except Exception as error:
+                status = jobs.retry_later(job_id, repr(error))
+            self.stdout.write(f'Задание {job_id}: {status}')
+        return healthy
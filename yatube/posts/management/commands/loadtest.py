@@ -0,0 +1,113 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from posts import loadtest, worker
+
+# Сколько секунд дать процессам пула на запуск Django и вход.
+STARTUP_DELAY = 3
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест: процессы пула гоняют взвешенные сценарии '
+        'в приложении внутри процесса или на запущенном сервере. '
+        'Пишет в базу: запускайте на базе из manage.py seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного сервера, например http://127.0.0.1:8000; '
+                 'без него приложение работает внутри процессов пула.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Число процессов, каждый шлёт запросы друг за другом.')
+        parser.add_argument(
+            '--duration', type=int, default=30, help='Длительность, с.')
+        parser.add_argument(
+            '--interval', type=int, default=5,
+            help='Шаг отчёта по времени, с.')
+        parser.add_argument(
+            '--mix', default='',
+            help='Веса сценариев, например index=50,post_create=1; '
+                 'по умолчанию: ' + ','.join(
+                     f'{name}={scenario.weight}'
+                     for name, scenario in loadtest.SCENARIOS.items()))
+        parser.add_argument(
+            '--think-time', type=float, default=0.0,
+            help='Средняя пауза посетителя между запросами, с.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Сохранить отчёт в JSON.')
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options['mix']) or {
+                name: scenario.weight
+                for name, scenario in loadtest.SCENARIOS.items()
+            }
+        except ValueError as error:
+            raise CommandError(error)
+        workers = max(options['workers'], 1)
+        targets = loadtest.collect_targets(workers)
+        if not targets['posts']:
+            raise CommandError('В базе нет постов: запустите manage.py seed.')
+        if not targets['readers']:
+            self.stderr.write('Нет читателей с подписками, сценарии '
+                              'со входом пропущены.')
+            mix = {
+                name: weight for name, weight in mix.items()
+                if not loadtest.SCENARIOS[name].login
+            }
+        duration = options['duration']
+        started = time.time() + STARTUP_DELAY
+        connections.close_all()
+        with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=worker.init_worker) as executor:
+            futures = [
+                executor.submit(
+                    loadtest.run_worker, index, mix, targets, started,
+                    duration, options['url'], options['seed'],
+                    options['think_time'])
+                for index in range(workers)
+            ]
+            samples = [
+                sample for future in futures for sample in future.result()]
+        result = loadtest.report(samples, duration, options['interval'])
+        self.print_report(result)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({
+                    'url': options['url'] or 'in-process',
+                    'workers': workers,
+                    'duration': duration,
+                    'mix': mix,
+                    **result,
+                }, output, ensure_ascii=False, indent=2)
+
+    def print_report(self, result):
+        header = (
+            f'{"":<14} {"запросов":>9} {"в с":>8} {"p50":>8} {"p95":>8} '
+            f'{"p99":>8} {"ошибки":>7}')
+
+        def row(title, stats):
+            if not stats['requests']:
+                return f'{title:<14} {0:>9}'
+            return (
+                f'{title:<14} {stats["requests"]:>9} {stats["rps"]:>8.1f} '
+                f'{stats["p50_ms"]:>8.1f} {stats["p95_ms"]:>8.1f} '
+                f'{stats["p99_ms"]:>8.1f} {stats["errors"]:>7.2%}')
+
+        self.stdout.write('По времени')
+        self.stdout.write(header)
+        for window in result['timeline']:
+            self.stdout.write(row(f'{window["second"]} с', window))
+        self.stdout.write('По сценариям')
+        self.stdout.write(header)
+        for name, stats in result['scenarios'].items():
+            self.stdout.write(row(name, stats))
+        self.stdout.write(self.style.SUCCESS(row('Всего', result['total'])))
@@ -0,0 +1,85 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.seed import REFERENCE_TIME, Seeder
+
+
+def moment(value):
+    """Дата ISO 8601 для --now; без пояса считается UTC."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'--now: не дата ISO 8601: {value}')
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу синтетическими данными для нагрузочных тестов: '
+        'пользователи, группы, посты, комментарии и подписки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument(
+            '--group-share', type=float, default=0.5,
+            help='Доля постов, опубликованных в группах.')
+        parser.add_argument(
+            '--group-skew', type=float, default=1.0,
+            help='Показатель Zipf для размеров групп; 0 — поровну.')
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель Zipf для числа постов, подписчиков '
+                 'и комментариев.')
+        parser.add_argument(
+            '--images', type=float, default=0.0,
+            help='Доля постов с картинкой.')
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней разбросать даты.')
+        parser.add_argument(
+            '--now', type=moment, default=REFERENCE_TIME,
+            help='До какого момента разбросать даты, ISO 8601; '
+                 f'по умолчанию {REFERENCE_TIME.date()}, чтобы '
+                 'данные повторялись.')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора: одно зерно — одни и те же данные.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--no-timelines', action='store_false', dest='timelines',
+            help='Не собирать ленты подписок; их соберёт '
+                 'manage.py rebuild_timelines.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 and (
+                options['posts'] or options['follows']):
+            raise CommandError('Для постов и подписок нужно --users >= 2.')
+        if not 0 <= options['images'] <= 1:
+            raise CommandError('--images — доля от 0 до 1.')
+        seeder = Seeder(
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            skew=options['skew'],
+            group_skew=options['group_skew'],
+            days=options['days'],
+            now=options['now'],
+            log=self.stdout.write,
+        )
+        seeder.run(
+            users=options['users'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows=options['follows'],
+            groups=options['groups'],
+            group_share=options['group_share'],
+            images=options['images'],
+            timelines=options['timelines'],
+        )
+        self.stdout.write(self.style.SUCCESS('База наполнена'))
@@ -0,0 +1,82 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import parse_http_date_safe
+
+from core.instrumentation import record_cache
+
+from .cache import page_version
+
+PAGE_KEY = 'page_cache:{}'
+
+
+class AnonymousPageCacheMiddleware:
+    """Кеш целых страниц для анонимных посетителей.
+
+    Кешируются только ответы view, пометивших страницу ключами через
+    add_surrogate_keys(). Запись хранит ключи и их версии на момент
+    сохранения; purge_pages() увеличивает версию ключа, и все страницы
+    с ним перестают совпадать. Те же ключи уходят в заголовке
+    Surrogate-Key, а s-maxage разрешает кешировать ответ прокси.
+    Стоит после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.is_cacheable_request(request):
+            response = self.get_response(request)
+            if getattr(request, 'surrogate_keys', None):
+                patch_cache_control(response, private=True)
+            return response
+        cache_key = PAGE_KEY.format(
+            hashlib.md5(request.build_absolute_uri().encode()).hexdigest())
+        entry = cache.get(cache_key)
+        if entry is not None:
+            keys, version, response = entry
+            if page_version(keys) == version:
+                record_cache(True)
+                response['X-Page-Cache'] = 'hit'
+                return self.conditional(request, response)
+        record_cache(False)
+        response = self.get_response(request)
+        keys = getattr(request, 'surrogate_keys', None)
+        if not keys or not self.is_cacheable_response(request, response):
+            return response
+        response['Surrogate-Key'] = ' '.join(sorted(keys))
+        patch_cache_control(
+            response, public=True, max_age=0,
+            s_maxage=settings.PAGE_CACHE_TIMEOUT)
+        cache.set(
+            cache_key, (keys, page_version(keys), response),
+            settings.PAGE_CACHE_TIMEOUT)
+        response['X-Page-Cache'] = 'miss'
+        return response
+
+    def is_cacheable_request(self, request):
+        return (
+            settings.PAGE_CACHE
+            and request.method == 'GET'
+            and not request.user.is_authenticated
+        )
+
+    def is_cacheable_response(self, request, response):
+        # Страница с CSRF-токеном или своими cookie привязана к посетителю.
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not request.META.get('CSRF_COOKIE_USED')
+        )
+
+    def conditional(self, request, response):
+        return get_conditional_response(
+            request,
+            etag=response.get('ETag'),
+            last_modified=parse_http_date_safe(
+                response.get('Last-Modified', '')),
+            response=response,
+        )
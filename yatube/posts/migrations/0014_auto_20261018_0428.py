@@ -0,0 +1,74 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:28
+
+import heapq
+from collections import defaultdict
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    """Собрать ленты из Follow и Post, как timeline.rebuild_all, на
+    исторических моделях: follow_index читает только эту таблицу."""
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    size = settings.TIMELINE_SIZE
+    recent = defaultdict(list)
+    posts = Post.objects.order_by('-pub_date', '-id').values_list(
+        'pub_date', 'id', 'author_id')
+    for pub_date, post_id, author_id in posts.iterator():
+        if len(recent[author_id]) < size:
+            recent[author_id].append((pub_date, post_id))
+    # Повторы подписок удалит только 0016, поэтому distinct.
+    follows = Follow.objects.order_by('user_id', 'author_id').values_list(
+        'user_id', 'author_id').distinct()
+    entries = []
+    for user_id, pairs in groupby(follows.iterator(), itemgetter(0)):
+        merged = heapq.merge(
+            *(recent[author_id] for _, author_id in pairs), reverse=True)
+        entries.extend(
+            TimelineEntry(user_id=user_id, post_id=post_id,
+                          pub_date=pub_date)
+            for pub_date, post_id in islice(merged, size))
+        if len(entries) >= 10000:
+            TimelineEntry.objects.bulk_create(entries)
+            entries = []
+    TimelineEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0013_auto_20221128_1415'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post', verbose_name='Пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+                'ordering': ('-pub_date',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date'], name='timeline_user_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from posts.search import FTS_TABLE, fts_available, install_fts
+
+
+def create_fts(apps, schema_editor):
+    install_fts(schema_editor.connection)
+
+
+def drop_fts(apps, schema_editor):
+    if not fts_available(schema_editor.connection):
+        return
+    for suffix in ('ai', 'ad', 'au'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_auto_20261018_0431'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
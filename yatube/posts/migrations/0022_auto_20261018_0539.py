@@ -0,0 +1,74 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import (CharField, ExpressionWrapper, F, IntegerField,
+                              Value)
+from django.db.models.functions import Cast, LPad
+
+ROOT_WIDTH = 10
+
+
+def index_existing_comments(apps, schema_editor):
+    # Все старые комментарии — корни веток, как в posts.threads.root_path.
+    Comment = apps.get_model('posts', 'Comment')
+    distance = ExpressionWrapper(
+        Value(10 ** ROOT_WIDTH - 1) - F('pk'), output_field=IntegerField())
+    Comment.objects.update(
+        thread=F('pk'),
+        path=LPad(Cast(distance, CharField()), ROOT_WIDTH, Value('0')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_auto_20261018_0535'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Уровень'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='last_reply',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Последний номер ответа в ветке'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.Comment', verbose_name='Ответ на'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Путь в ветке'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='position',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Номер в ветке'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='thread',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread_comments', to='posts.Comment', verbose_name='Ветка'),
+        ),
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_post_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'depth', 'path'], name='comment_post_depth_path_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['thread', 'position'], name='comment_thread_position_idx'),
+        ),
+        migrations.RunPython(
+            index_existing_comments, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,75 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import connections, models
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .search import FTS_TABLE, fts_available, fts_query
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
 
-class Post(models.Model):
+class CountersMixin:
+    """Не перезаписывать счётчики устаревшими значениями при save()."""
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+# Колонки, которые выводят карточки постов: без них в ленту попадали
+# целые строки пользователей вместе с хешами паролей.
+FEED_FIELDS = (
+    'text', 'pub_date', 'updated', 'image', 'image_width', 'image_height',
+    'comments_count',
+    'author__username', 'author__first_name', 'author__last_name',
+    'group__title', 'group__slug',
+)
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа в том же запросе, только
+        выводимые колонки. Число комментариев берётся из счётчика
+        comments_count, а не из Count() с GROUP BY."""
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+    def for_detail(self):
+        """Пост для своей страницы: те же колонки, что и в ленте."""
+        return self.for_feed()
+
+    def search(self, text):
+        """Найти посты по тексту, лучшие совпадения в поле rank меньше."""
+        if not fts_available(connections[self.db]):
+            return self.filter(text__icontains=text).annotate(
+                rank=Value(0.0, output_field=FloatField()))
+        return self.extra(
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE}.rowid = posts_post.id',
+                f'{FTS_TABLE} MATCH %s',
+            ],
+            params=[fts_query(text)],
+        ).annotate(
+            rank=RawSQL(f'{FTS_TABLE}.rank', [], output_field=FloatField()))
+
+
+class Post(CountersMixin, models.Model):
     text = models.TextField(max_length=30, verbose_name='Текст поста',)
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
         auto_now_add=True)
+    # Версия карточки поста в кеше лент (posts.cards).
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Изменён')
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE, related_name='posts', verbose_name='Автор'
@@ -24,20 +85,54 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Ширина картинки')
+    image_height = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Высота картинки')
+    image_size = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Размер картинки в байтах')
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число комментариев')
+
+    objects = PostQuerySet.as_manager()
+
+    counter_fields = ('comments_count',)
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=('-pub_date',), name='post_date_idx'),
+            models.Index(
+                fields=('author', '-pub_date'), name='post_author_date_idx'),
+            models.Index(
+                fields=('group', '-pub_date'), name='post_group_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
-class Group(models.Model):
+class Group(CountersMixin, models.Model):
     title = models.CharField(max_length=200, verbose_name='Заголовок')
     slug = models.SlugField(max_length=100, unique=True, verbose_name='ЧПУ')
     description = models.TextField(max_length=400, verbose_name='Описание')
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число постов')
+
+    counter_fields = ('posts_count',)
 
     def __str__(self):
         return self.title
@@ -59,11 +154,55 @@ class Comment(models.Model):
     created = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Создан')
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='replies',
+        verbose_name='Ответ на')
+    # Ветка — корневой комментарий; путь и номер в ветке заполняет
+    # posts.threads при сохранении.
+    thread = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        editable=False,
+        related_name='thread_comments',
+        verbose_name='Ветка')
+    path = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+        verbose_name='Путь в ветке')
+    depth = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Уровень')
+    position = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Номер в ветке')
+    last_reply = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Последний номер ответа в ветке')
 
     class Meta:
         ordering = ['-created']
         verbose_name_plural = 'Коментарии'
         verbose_name = 'Коментарий'
+        # Комментарии поста выбираются по веткам и путям; индекс
+        # по (post, created) больше ни одному запросу не нужен.
+        indexes = [
+            models.Index(
+                fields=('post', 'depth', 'path'),
+                name='comment_post_depth_path_idx'),
+            models.Index(
+                fields=('thread', 'position'),
+                name='comment_thread_position_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -84,6 +223,148 @@ class Follow(models.Model):
     class Meta:
         verbose_name_plural = 'Подписки'
         verbose_name = 'Подписка'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'), name='unique_follow'),
+        ]
 
     def __str__(self):
         return f'{self.user} подписался на {self.author}'
+
+
+class TimelineEntry(models.Model):
+    """Запись ленты подписок, разложенная по читателю при публикации."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост')
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации')
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name_plural = 'Записи лент'
+        verbose_name = 'Запись ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'), name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post} в ленте {self.user}'
+
+
+class UserCounter(models.Model):
+    """Счётчики пользователя, обновляемые при сохранении и удалении."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='counters',
+        verbose_name='Пользователь')
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число постов')
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число подписчиков')
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число подписок')
+
+    class Meta:
+        verbose_name_plural = 'Счётчики пользователей'
+        verbose_name = 'Счётчики пользователя'
+
+    def __str__(self):
+        return f'Счётчики {self.user}'
+
+
+class ImageJob(models.Model):
+    """Задание на обработку картинки поста для manage.py image_worker."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='image_jobs',
+        verbose_name='Пост')
+    kind = models.CharField(
+        max_length=32,
+        verbose_name='Тип задания')
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток')
+    run_after = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Запустить после')
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка')
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создано')
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Обновлено')
+
+    class Meta:
+        ordering = ('run_after',)
+        verbose_name_plural = 'Задания обработки картинок'
+        verbose_name = 'Задание обработки картинки'
+        indexes = [
+            models.Index(
+                fields=('status', 'run_after'), name='imagejob_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} для поста {self.post_id}: {self.status}'
+
+
+class ImageBlob(models.Model):
+    """Файл картинки в хранилище по хешу и число постов, которые на него
+    ссылаются. Файлы без ссылок удаляет manage.py collect_images."""
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Файл')
+    refs = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число ссылок')
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создан')
+
+    class Meta:
+        verbose_name_plural = 'Файлы картинок'
+        verbose_name = 'Файл картинки'
+        indexes = [
+            models.Index(fields=('refs',), name='imageblob_refs_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.refs})'
@@ -0,0 +1,61 @@
+FTS_TABLE = 'posts_post_fts'
+
+FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text, content='posts_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai
+        AFTER INSERT ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad
+        AFTER DELETE ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF text ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+        END""",
+]
+
+
+def fts_available(connection):
+    return connection.vendor == 'sqlite'
+
+
+def install_fts(connection):
+    """Создать индекс FTS5 и триггеры, если их ещё нет.
+
+    Миграции SQLite пересоздают posts_post при изменении полей и теряют
+    триггеры, поэтому установка повторяется после каждого migrate.
+    """
+    if not fts_available(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE])
+        created = cursor.fetchone() is None
+        for statement in FTS_SQL:
+            cursor.execute(statement)
+        if created:
+            rebuild_fts(connection)
+
+
+def rebuild_fts(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def fts_query(text):
+    """Превратить ввод пользователя в безопасный запрос MATCH.
+
+    Каждое слово берётся в кавычки и ищется по префиксу.
+    """
+    terms = ['"{}"*'.format(word.replace('"', '""')) for word in text.split()]
+    return ' '.join(terms)
@@ -0,0 +1,284 @@
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from faker import Faker
+from PIL import Image, ImageDraw
+
+from . import counters, threads, timeline
+from .blobs import count_refs, image_storage
+from .images import normalize_image
+from .models import Comment, Follow, Group, ImageBlob, Post
+from .thumbnails import generate_thumbnails
+
+User = get_user_model()
+
+# Сколько разных текстов, имён и картинок генерирует Faker и Pillow;
+# дальше они берутся из этих наборов, иначе Faker считает часами.
+TEXT_POOL = 5000
+NAME_POOL = 2000
+IMAGE_POOL = 8
+IMAGE_SIZE = (1600, 1000)
+PASSWORD = 'password'
+# Даты разбрасываются до этого момента, а не до текущего времени,
+# иначе при одном seed каждый запуск даёт другие даты.
+REFERENCE_TIME = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def zipf_weights(count, skew, rng):
+    """Накопленные веса для rng.choices: k-й по популярности весит
+    1 / k ** skew, места по популярности раздаются случайно."""
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return list(accumulate(1 / rank ** skew for rank in ranks))
+
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Дать bulk_create записать свои даты в поля с auto_now_add."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Seeder:
+    """Наполняет базу синтетическими пользователями, группами, постами,
+    комментариями и подписками.
+
+    Число постов у автора и подписчиков у него распределено по Zipf
+    (skew), так же посты делятся между группами (group_skew). При одном
+    и том же seed и now на пустой базе получаются одни и те же данные.
+    Сигналы при bulk_create не срабатывают, поэтому счётчики и ленты
+    подписок пересчитываются в конце целиком.
+    """
+
+    def __init__(self, seed=0, batch_size=5000, skew=1.1, group_skew=1.0,
+                 days=365, now=None, log=None):
+        self.rng = random.Random(seed)
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(seed)
+        self.batch_size = batch_size
+        self.skew = skew
+        self.group_skew = group_skew
+        self.days = days
+        self.log = log or (lambda message: None)
+        self.now = (now or REFERENCE_TIME).timestamp()
+
+    def run(self, users, posts, comments, follows, groups=0,
+            group_share=0.5, images=0.0, timelines=True):
+        started = time.monotonic()
+        user_ids = self.create_users(users)
+        author_weights = zipf_weights(len(user_ids), self.skew, self.rng)
+        group_ids = self.create_groups(groups)
+        post_ids, post_dates = self.create_posts(
+            posts, user_ids, author_weights, group_ids, group_share, images)
+        self.create_comments(comments, user_ids, post_ids, post_dates)
+        self.create_follows(follows, user_ids, author_weights)
+        self.log('Пересчёт счётчиков')
+        with transaction.atomic():
+            counters.reconcile()
+        if timelines:
+            # До TIMELINE_SIZE записей на читателя — самая долгая часть.
+            self.log('Ленты подписок')
+            with transaction.atomic():
+                timeline.rebuild_all()
+        cache.clear()
+        self.log(f'Готово за {time.monotonic() - started:.1f} с')
+
+    def random_date(self, since=None):
+        since = since or self.now - self.days * 86400
+        return since + self.rng.random() * (self.now - since)
+
+    def as_datetime(self, timestamp):
+        return datetime.fromtimestamp(timestamp, dt_timezone.utc)
+
+    def insert(self, model, objects, **options):
+        with transaction.atomic():
+            for batch in batches(objects, self.batch_size):
+                model.objects.bulk_create(batch, **options)
+
+    def new_ids(self, model, after):
+        return array('q', model.objects.filter(pk__gt=after).order_by(
+            'pk').values_list('pk', flat=True).iterator())
+
+    def last_id(self, model):
+        last = model.objects.order_by('-pk').values_list(
+            'pk', flat=True).first()
+        return last or 0
+
+    def create_users(self, count):
+        self.log(f'Пользователи: {count}')
+        offset = self.last_id(User)
+        names = [self.fake.user_name() for _ in range(NAME_POOL)]
+        first_names = [self.fake.first_name() for _ in range(NAME_POOL)]
+        last_names = [self.fake.last_name() for _ in range(NAME_POOL)]
+        password = make_password(PASSWORD)
+        self.insert(User, (
+            User(
+                username=f'{self.rng.choice(names)}{offset + index}',
+                first_name=self.rng.choice(first_names),
+                last_name=self.rng.choice(last_names),
+                password=password,
+            )
+            for index in range(count)
+        ))
+        return self.new_ids(User, offset)
+
+    def create_groups(self, count):
+        self.log(f'Группы: {count}')
+        offset = self.last_id(Group)
+        self.insert(Group, (
+            Group(
+                title=self.fake.sentence(nb_words=3)[:200],
+                slug=f'group-{offset + index}',
+                description=self.fake.paragraph()[:400],
+            )
+            for index in range(count)
+        ))
+        return self.new_ids(Group, offset)
+
+    def create_posts(self, count, user_ids, author_weights, group_ids,
+                     group_share, images):
+        self.log(f'Посты: {count}')
+        offset = self.last_id(Post)
+        texts = [self.fake.sentence() for _ in range(TEXT_POOL)]
+        pictures = self.create_images() if images else []
+        group_weights = zipf_weights(
+            len(group_ids), self.group_skew, self.rng)
+        # Посты идут по возрастанию даты, как если бы их публиковали.
+        dates = array('d', sorted(
+            self.random_date() for _ in range(count)))
+
+        def generate():
+            for date in dates:
+                post = Post(
+                    text=self.rng.choice(texts),
+                    pub_date=self.as_datetime(date),
+                    author_id=self.rng.choices(
+                        user_ids, cum_weights=author_weights)[0],
+                )
+                if group_ids and self.rng.random() < group_share:
+                    post.group_id = self.rng.choices(
+                        group_ids, cum_weights=group_weights)[0]
+                if pictures and self.rng.random() < images:
+                    (post.image, post.image_width, post.image_height,
+                     post.image_size) = self.rng.choice(pictures)
+                yield post
+
+        with explicit_dates(Post._meta.get_field('pub_date')):
+            self.insert(Post, generate())
+        if pictures:
+            self.register_images(pictures)
+        return self.new_ids(Post, offset), dates
+
+    def create_comments(self, count, user_ids, post_ids, post_dates):
+        self.log(f'Комментарии: {count}')
+        if not post_ids:
+            return
+        texts = [self.fake.sentence() for _ in range(TEXT_POOL)]
+        # Обсуждают в основном немногие посты.
+        post_weights = zipf_weights(len(post_ids), self.skew, self.rng)
+        positions = range(len(post_ids))
+
+        def generate():
+            for _ in range(count):
+                position = self.rng.choices(
+                    positions, cum_weights=post_weights)[0]
+                yield Comment(
+                    post_id=post_ids[position],
+                    author_id=self.rng.choice(user_ids),
+                    text=self.rng.choice(texts),
+                    created=self.as_datetime(
+                        self.random_date(post_dates[position])),
+                )
+
+        with explicit_dates(Comment._meta.get_field('created')):
+            self.insert(Comment, generate())
+        # Все комментарии сида — корни веток.
+        with transaction.atomic():
+            threads.index_roots()
+
+    def create_follows(self, count, user_ids, author_weights):
+        """Подписки на авторов с теми же весами, что и число их постов:
+        кто много пишет, у того и много подписчиков."""
+        self.log(f'Подписки: {count}')
+        count = min(count, len(user_ids) * (len(user_ids) - 1))
+        seen = set()
+        # Популярные пары повторяются, поэтому попыток даётся с запасом.
+        attempts = count * 10
+
+        def generate():
+            nonlocal attempts
+            while len(seen) < count and attempts:
+                attempts -= 1
+                user_id = self.rng.choice(user_ids)
+                author_id = self.rng.choices(
+                    user_ids, cum_weights=author_weights)[0]
+                pair = (user_id, author_id)
+                if user_id == author_id or pair in seen:
+                    continue
+                seen.add(pair)
+                yield Follow(user_id=user_id, author_id=author_id)
+
+        self.insert(Follow, generate(), ignore_conflicts=True)
+
+    def create_images(self):
+        """Несколько картинок в хранилище; посты ссылаются на них,
+        а хранилище по хешу держит каждую в одном файле."""
+        storage = image_storage()
+        pictures = []
+        for index in range(IMAGE_POOL):
+            image = Image.new('RGB', IMAGE_SIZE, self.random_color())
+            draw = ImageDraw.Draw(image)
+            for _ in range(12):
+                left = self.rng.randrange(IMAGE_SIZE[0])
+                top = self.rng.randrange(IMAGE_SIZE[1])
+                draw.rectangle(
+                    (left, top, left + self.rng.randrange(50, 600),
+                     top + self.rng.randrange(50, 400)),
+                    fill=self.random_color())
+            buffer = BytesIO()
+            image.save(buffer, 'PNG')
+            normalized = normalize_image(SimpleUploadedFile(
+                f'seed{index}.png', buffer.getvalue()))
+            name = storage.save(f'posts/{normalized.name}', normalized)
+            pictures.append(
+                (name, normalized.width, normalized.height, normalized.size))
+        return pictures
+
+    def random_color(self):
+        return tuple(self.rng.randrange(256) for _ in range(3))
+
+    def register_images(self, pictures):
+        self.log('Миниатюры картинок')
+        for name, *_ in pictures:
+            ImageBlob.objects.update_or_create(
+                name=name, defaults={'refs': count_refs(name)})
+            post = Post.objects.filter(image=name).first()
+            if post is not None:
+                # Миниатюры одного файла общие для всех его постов.
+                generate_thumbnails(post)
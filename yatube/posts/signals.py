@@ -0,0 +1,208 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import blobs, counters, threads, timeline
+from .cache import (bump_version, feed_page_keys, group_page_keys,
+                    group_surrogate_key, post_scopes, purge_pages)
+from .cards import touch_posts
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+CARD_USER_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_values(sender, instance, **kwargs):
+    instance._old_group_id, instance._old_image = None, ''
+    if instance.pk:
+        old = Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'image').first()
+        if old:
+            instance._old_group_id, instance._old_image = old
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counter(instance.author_id, 'posts_count', 1)
+        counters.change_group_counter(instance.group_id, 1)
+    elif instance._old_group_id != instance.group_id:
+        counters.change_group_counter(instance._old_group_id, -1)
+        counters.change_group_counter(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'posts_count', -1)
+    counters.change_group_counter(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, **kwargs):
+    if instance.image.name != instance._old_image:
+        blobs.add_ref(instance.image.name)
+        blobs.release(instance._old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    blobs.release(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, **kwargs):
+    bump_version(*post_scopes(
+        instance.author_id,
+        instance.group_id,
+        getattr(instance, '_old_group_id', None),
+    ))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, **kwargs):
+    purge_pages(*feed_page_keys(
+        instance, getattr(instance, '_old_group_id', None)))
+
+
+@receiver(pre_save, sender=Group)
+def remember_old_slug(sender, instance, **kwargs):
+    instance._old_slug = None
+    if instance.pk:
+        instance._old_slug = Group.objects.filter(
+            pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+def purge_group_pages(sender, instance, **kwargs):
+    purge_pages(group_surrogate_key(instance.slug))
+
+
+def refresh_post_cards(posts, *keys):
+    """Сбросить карточки posts и все ленты и страницы, где они видны.
+
+    Сдвигает updated постов, версии лент их авторов, групп и главной
+    (фрагменты {% cache %} и ETag) и сбрасывает страницы с ключами
+    авторов (профиль и страницы постов), групп и keys.
+    """
+    pairs = set(posts.order_by().values_list(
+        'author_id', 'group_id').distinct())
+    if not pairs:
+        return
+    touch_posts(posts)
+    scopes = set()
+    for author_id, group_id in pairs:
+        scopes.update(post_scopes(author_id, group_id))
+    bump_version(*sorted(scopes))
+    purge_pages(
+        'index',
+        *sorted({f'author-{author_id}' for author_id, _ in pairs}),
+        *group_page_keys(*{group_id for _, group_id in pairs}),
+        *keys)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def refresh_group_cards(sender, instance, **kwargs):
+    # Карточки выводят название и ссылку группы; при удалении посты
+    # теряют группу через SET_NULL, минуя сигналы Post.
+    old_slug = getattr(instance, '_old_slug', None)
+    refresh_post_cards(
+        Post.objects.filter(group_id=instance.pk),
+        group_surrogate_key(old_slug) if old_slug else None)
+
+
+@receiver(pre_save, sender=User)
+def remember_user_names(sender, instance, update_fields=None, **kwargs):
+    instance._old_names = None
+    if instance.pk and (
+            update_fields is None
+            or set(update_fields) & set(CARD_USER_FIELDS)):
+        instance._old_names = User.objects.filter(
+            pk=instance.pk).values_list(*CARD_USER_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def refresh_author_cards(sender, instance, created, **kwargs):
+    names = tuple(getattr(instance, field) for field in CARD_USER_FIELDS)
+    old_names = getattr(instance, '_old_names', None)
+    if not created and old_names is not None and old_names != names:
+        refresh_post_cards(Post.objects.filter(author_id=instance.pk))
+
+
+@receiver(pre_save, sender=Comment)
+def place_reply(sender, instance, **kwargs):
+    if instance.pk is None and instance.parent_id is not None:
+        threads.place(instance)
+
+
+@receiver(post_save, sender=Comment)
+def index_thread_root(sender, instance, created, **kwargs):
+    if created and instance.parent_id is None:
+        threads.index_root(instance)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post_counter(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change_post_counter(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_feeds(sender, instance, **kwargs):
+    post = Post.objects.filter(pk=instance.post_id).values(
+        'author_id', 'group_id').first()
+    if post is not None:
+        bump_version(*post_scopes(post['author_id'], post['group_id']))
+    purge_pages(f'comments-{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counter(instance.user_id, 'following_count', 1)
+        counters.change_user_counter(
+            instance.author_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+    counters.change_user_counter(instance.author_id, 'followers_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_pages(sender, instance, **kwargs):
+    # Профиль автора показывает число подписчиков и кнопку подписки,
+    # профиль читателя — число его подписок.
+    bump_version(f'followers:{instance.author_id}',
+                 f'followers:{instance.user_id}')
+    purge_pages(f'followers-{instance.author_id}',
+                f'followers-{instance.user_id}')
@@ -0,0 +1,51 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла — хеш его содержимого.
+
+    Файл из upload_to='posts/' сохраняется как posts/ab/cd/abcd….jpg:
+    два уровня подкаталогов по первым символам хеша держат каталоги
+    небольшими, а одинаковые загрузки попадают в один и тот же файл.
+    Учёт ссылок на файлы и удаление ненужных — в posts.blobs.
+    """
+
+    shard_depth = 2
+    shard_width = 2
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # Свежее время изменения не даст collect_images удалить файл,
+            # пока пост с ним ещё не сохранён.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        hexdigest = digest.hexdigest()
+        shards = [
+            hexdigest[index * self.shard_width:(index + 1) * self.shard_width]
+            for index in range(self.shard_depth)
+        ]
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = os.path.splitext(filename)[1].lower()
+        return posixpath.join(directory, *shards, hexdigest + extension)
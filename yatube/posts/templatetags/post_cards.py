@@ -0,0 +1,14 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts.cards import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts, template_name):
+    """Карточки постов страницы из кеша, недостающие — рендером."""
+    return [
+        mark_safe(card) for card in render_cards(list(posts), template_name)
+    ]
@@ -0,0 +1,47 @@
+from django import template
+from django.conf import settings
+
+from posts.images import EXTENSIONS
+from posts.thumbnails import get_variants
+
+register = template.Library()
+
+
+def srcset(variants):
+    return ', '.join(
+        f'{thumbnail.url} {width}w' for width, thumbnail in variants)
+
+
+@register.inclusion_tag('includes/post_image.html')
+def post_picture(post, img_class=''):
+    """Картинка поста с вариантами в srcset или заглушка, пока их нет."""
+    context = {
+        'img_class': img_class, 'has_image': bool(post.image), 'ready': False,
+    }
+    if not post.image:
+        return context
+    variants = get_variants(post)
+    fallback = variants.pop('JPEG')
+    if not fallback:
+        return context
+    # src для браузеров без srcset — вариант под ширину колонки; его
+    # width и height резервируют место под картинку до загрузки.
+    src = fallback[-1][1]
+    for width, thumbnail in fallback:
+        if width >= settings.POST_IMAGE_RATIO[0]:
+            src = thumbnail
+            break
+    context.update({
+        'ready': True,
+        'sources': [
+            {'type': f'image/{EXTENSIONS[image_format]}',
+             'srcset': srcset(found)}
+            for image_format, found in variants.items() if found
+        ],
+        'srcset': srcset(fallback),
+        'src': src.url,
+        'width': src.width,
+        'height': src.height,
+        'sizes': settings.POST_IMAGE_SIZES,
+    })
+    return context
@@ -1,12 +1,20 @@
+import shutil
+import tempfile
 from http import HTTPStatus
+from io import BytesIO
 
+from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from ..models import Comment, Group, Post, User
 
+ORIENTATION_TAG = 0x0112
 
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
 class PostFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -40,6 +48,11 @@ class PostFormTests(TestCase):
             b'\x0A\x00\x3B'
         )
 
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
     def setUp(self):
         self.guest_user = Client()
         self.authorized_user = Client()
@@ -136,3 +149,66 @@ class PostFormTests(TestCase):
         self.assertEqual(comment.post_id, post.id)
         self.assertRedirects(
             response, reverse('posts:post_detail', args={post.id}))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_MAX_SIZE=(100, 100))
+class ImageIngestTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def upload(self, size, exif=None):
+        buffer = BytesIO()
+        image = Image.new('RGB', size, 'red')
+        if exif is None:
+            image.save(buffer, 'JPEG')
+        else:
+            image.save(buffer, 'JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile(
+            'photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_is_rotated_downscaled_and_stripped(self):
+        """Картинка поворачивается по EXIF, уменьшается и теряет EXIF."""
+        exif = Image.Exif()
+        exif[ORIENTATION_TAG] = 6
+        self.client.post(reverse('posts:create'), {
+            'text': 'Фото', 'image': self.upload((400, 200), exif)})
+        post = Post.objects.latest('id')
+        self.assertEqual((post.image_width, post.image_height), (50, 100))
+        self.assertEqual(post.image_size, post.image.size)
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (50, 100))
+            self.assertNotIn(ORIENTATION_TAG, stored.getexif())
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_oversized_resolution_is_rejected(self):
+        """Картинка с огромным разрешением не принимается."""
+        response = self.client.post(reverse('posts:create'), {
+            'text': 'Фото', 'image': self.upload((20, 20))})
+        self.assertFormError(
+            response, 'form', 'image', 'Слишком большое разрешение.')
+        self.assertFalse(Post.objects.exists())
+
+    def test_truncated_upload_is_rejected(self):
+        """Обрезанная картинка, которая открывается, но не декодируется,
+        даёт ошибку формы, а не 500."""
+        buffer = BytesIO()
+        Image.effect_noise((400, 400), 64).convert('RGB').save(
+            buffer, 'JPEG')
+        truncated = SimpleUploadedFile(
+            'photo.jpg', buffer.getvalue()[:buffer.tell() // 2],
+            content_type='image/jpeg')
+        response = self.client.post(reverse('posts:create'), {
+            'text': 'Фото', 'image': truncated})
+        self.assertFormError(
+            response, 'form', 'image', 'Картинка повреждена или обрезана.')
+        self.assertFalse(Post.objects.exists())
@@ -1,7 +1,20 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import skipUnless
+
 from django.conf import settings
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max, Min
+from django.test import TestCase, override_settings
 
-from ..models import Group, Post, User
+from .. import blobs, timeline
+from ..models import (Comment, Follow, Group, ImageBlob, Post,
+                      TimelineEntry, User, UserCounter)
 
 
 class PostModelTest(TestCase):
@@ -33,3 +46,229 @@ class GroupModelTest(TestCase):
     def test_group_str(self):
         """Проверка __str__ у group."""
         self.assertEqual(self.group.title, str(self.group))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='counters',
+            description='Описание',
+        )
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(
+            text='Пост', author=self.author, group=self.group)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.author.counters.posts_count, 1)
+        self.assertEqual(
+            UserCounter.objects.get(user=self.author).followers_count, 1)
+        self.assertEqual(
+            UserCounter.objects.get(user=self.reader).following_count, 1)
+        comment.delete()
+        follow.delete()
+        post.group = None
+        post.save()
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(
+            UserCounter.objects.get(user=self.author).followers_count, 0)
+
+    def test_reconcile_counters(self):
+        """Команда reconcile_counters исправляет разошедшиеся счётчики."""
+        post = Post.objects.create(
+            text='Пост', author=self.author, group=self.group)
+        Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        Post.objects.update(comments_count=5)
+        Group.objects.update(posts_count=5)
+        UserCounter.objects.all().delete()
+        call_command('reconcile_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(
+            UserCounter.objects.get(user=self.author).posts_count, 1)
+        self.assertEqual(
+            UserCounter.objects.get(user=self.reader).posts_count, 0)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class FeedIndexesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='indexes',
+            description='Описание',
+        )
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.user, group=cls.group)
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return ' '.join(str(row[-1]) for row in cursor.fetchall())
+
+    def test_feeds_use_composite_indexes(self):
+        """Запросы лент читают составные индексы."""
+        feeds = {
+            'post_author_date_idx': Post.objects.filter(author=self.user),
+            'post_group_date_idx': self.group.posts.all(),
+            'comment_post_depth_path_idx':
+                self.post.comments.filter(depth=0).order_by('path'),
+            # SQLite хранит UniqueConstraint как автоиндекс таблицы.
+            'autoindex_posts_follow_1 (user_id=? AND author_id=?)':
+                Follow.objects.filter(user=self.user, author=self.user),
+        }
+        for index, queryset in feeds.items():
+            with self.subTest(index=index):
+                self.assertIn(index, self.query_plan(queryset[:10]))
+
+    def test_follow_is_unique(self):
+        """Повторная подписка на автора не создаётся."""
+        author = User.objects.create_user(username='author')
+        Follow.objects.create(user=self.user, author=author)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Follow.objects.create(user=self.user, author=author)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def create_post(self, content=b'image', name='photo.jpg'):
+        post = Post(text='Пост', author=self.user)
+        post.image.save(name, ContentFile(content), save=False)
+        post.save()
+        return post
+
+    def test_identical_uploads_share_file(self):
+        """Одинаковые картинки хранятся одним файлом в шардах по хешу."""
+        first = self.create_post(name='first.jpg')
+        second = self.create_post(name='second.JPG')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(
+            first.image.name,
+            r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(ImageBlob.objects.get(name=first.image.name).refs, 2)
+
+    def test_refs_follow_edit_and_delete(self):
+        """Замена и удаление картинки уменьшают число ссылок."""
+        post = self.create_post()
+        old_name = post.image.name
+        post.image.save('other.jpg', ContentFile(b'other'))
+        self.assertEqual(ImageBlob.objects.get(name=old_name).refs, 0)
+        new_name = post.image.name
+        post.delete()
+        self.assertEqual(ImageBlob.objects.get(name=new_name).refs, 0)
+
+    def test_collect_removes_only_unreferenced_files(self):
+        """collect_images удаляет старые файлы без ссылок и сироты."""
+        kept = self.create_post(b'kept')
+        released = self.create_post(b'released')
+        released_name = released.image.name
+        released.delete()
+        storage = blobs.image_storage()
+        orphan_name = storage.save('posts/orphan.jpg', ContentFile(b'orphan'))
+        self.assertEqual(blobs.collect(), [])
+        removed = blobs.collect(grace=0, dry_run=True)
+        self.assertEqual(sorted(removed), sorted([released_name, orphan_name]))
+        self.assertTrue(storage.exists(released_name))
+        out = StringIO()
+        call_command('collect_images', grace=0, stdout=out)
+        self.assertIn('Удалено файлов: 2', out.getvalue())
+        self.assertFalse(storage.exists(released_name))
+        self.assertFalse(storage.exists(orphan_name))
+        self.assertTrue(os.path.exists(kept.image.path))
+        self.assertFalse(ImageBlob.objects.filter(name=released_name).exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), TIMELINE_SIZE=5)
+class SeedCommandTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def seed(self, **options):
+        call_command(
+            'seed', users=30, posts=200, comments=100, follows=60,
+            groups=3, seed=7, stdout=StringIO(), **options)
+
+    def test_seed_creates_consistent_data(self):
+        """seed заполняет базу, счётчики и ленты совпадают с данными."""
+        self.seed(images=0.5)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertEqual(Follow.objects.count(), 60)
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        self.assertEqual(
+            len(set(Post.objects.values_list('pub_date', flat=True))), 200)
+        for post in Post.objects.filter(comments_count__gt=0)[:5]:
+            self.assertEqual(post.comments_count, post.comments.count())
+            self.assertFalse(post.comments.filter(
+                created__lt=post.pub_date).exists())
+        for follow in Follow.objects.all()[:5]:
+            seeded = list(TimelineEntry.objects.filter(
+                user_id=follow.user_id).values_list('post_id', flat=True))
+            timeline.rebuild(follow.user_id)
+            self.assertEqual(seeded, list(TimelineEntry.objects.filter(
+                user_id=follow.user_id).values_list('post_id', flat=True)))
+
+    def test_seed_is_deterministic(self):
+        """Одно зерно даёт одни и те же тексты, даты и распределение
+        постов."""
+        def snapshot():
+            first_user = User.objects.order_by('pk').first().pk
+            return [
+                (text, pub_date, author_id - first_user)
+                for text, pub_date, author_id in Post.objects.order_by('pk')
+                .values_list('text', 'pub_date', 'author_id')
+            ]
+
+        self.seed(timelines=False)
+        first = snapshot()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.seed(timelines=False)
+        self.assertEqual(first, snapshot())
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_seed_dates_end_at_now(self):
+        """Даты постов лежат в окне --days до момента --now."""
+        now = datetime(2030, 6, 1, tzinfo=dt_timezone.utc)
+        self.seed(days=10, now=now)
+        dates = Post.objects.aggregate(
+            first=Min('pub_date'), last=Max('pub_date'))
+        self.assertGreaterEqual(dates['first'], now - timedelta(days=10))
+        self.assertLessEqual(dates['last'], now)
+        with self.assertRaises(CommandError):
+            call_command('seed', '--now', 'вчера', stdout=StringIO())
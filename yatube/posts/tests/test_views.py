@@ -1,11 +1,40 @@
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+
+from .. import benchmark
+from .. import cache as cache_module
+from .. import cards, jobs, loadtest, threads
+from ..models import (Comment, Follow, Group, ImageJob, Post, TimelineEntry,
+                      User)
+from ..seed import Seeder
+from ..thumbnails import (generate_thumbnails, get_variants,
+                          variant_widths)
+from ..utils import NEXT, CursorPaginator, encode_cursor
 
-from ..models import Follow, Group, Post, User
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
 class PostPagesTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -61,6 +90,11 @@ class PostPagesTests(TestCase):
             reverse('posts:create'): ('posts/create_post.html'),
         }
 
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
     def setUp(self):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -109,14 +143,36 @@ class PostPagesTests(TestCase):
             author=self.user)
         content_add = self.authorized_client.get(
             reverse('posts:index')).content
+        Post.objects.filter(pk=post.pk).update(text='Текст мимо сигналов')
+        content_update = self.authorized_client.get(
+            reverse('posts:index')).content
+        self.assertEqual(content_add, content_update)
         post.delete()
         content_delete = self.authorized_client.get(
             reverse('posts:index')).content
-        self.assertEqual(content_add, content_delete)
-        cache.clear()
-        content_cache_clear = self.authorized_client.get(
+        self.assertNotEqual(content_add, content_delete)
+
+    def test_cache_varies_by_page(self):
+        """Кеш ленты хранит каждую страницу отдельно."""
+        Post.objects.bulk_create(
+            Post(text='Пост для второй страницы', author=self.user)
+            for _ in range(settings.NUMBER_POSTS)
+        )
+        first_page = self.authorized_client.get(
             reverse('posts:index')).content
-        self.assertNotEqual(content_add, content_cache_clear)
+        second_page = self.authorized_client.get(
+            reverse('posts:index'), {'page': 2}).content
+        self.assertNotEqual(first_page, second_page)
+
+    def test_group_cache_invalidated_on_edit(self):
+        """Правка поста сбрасывает кеш страницы группы."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.authorized_client.get(url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'Новый текст')
 
 
 class FollowViewsTest(TestCase):
@@ -196,3 +252,970 @@ class FollowViewsTest(TestCase):
         """Проверьте, что нельзя подписаться на самого себя"""
         self.authorized_client.get(self.PROFILE_FOLLOW_URL)
         self.assertEqual(self.user.follower.count(), 0)
+
+
+@override_settings(CURSOR_PAGINATION=True)
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='cursor_author')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=cls.user)
+            for number in range(settings.NUMBER_POSTS * 2 + 3)
+        )
+        cls.INDEX_REVERSE = reverse('posts:index')
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def get_page(self, cursor=None):
+        data = {'cursor': cursor} if cursor else {}
+        return self.guest_client.get(
+            self.INDEX_REVERSE, data).context['page_obj']
+
+    def test_cursor_pages_cover_all_posts(self):
+        """Курсоры вперёд и назад обходят ленту без пропусков."""
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        first_page = self.get_page()
+        self.assertFalse(first_page.has_previous())
+        pages = [first_page]
+        while pages[-1].has_next():
+            pages.append(self.get_page(pages[-1].next_cursor))
+        self.assertEqual(
+            [post for page in pages for post in page], expected)
+        previous_page = self.get_page(pages[1].previous_cursor)
+        self.assertEqual(list(previous_page), list(first_page))
+
+    def test_cursor_page_query_count_is_flat(self):
+        """Глубокая страница стоит столько же запросов, сколько первая."""
+        page = self.get_page()
+        deep_cursor = self.get_page(page.next_cursor).next_cursor
+        paginator = CursorPaginator(Post.objects.all(), settings.NUMBER_POSTS)
+        with self.assertNumQueries(1):
+            paginator.get_page(deep_cursor)
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор открывает первую страницу."""
+        self.assertEqual(
+            list(self.get_page('broken')), list(self.get_page()))
+
+    def test_forged_cursor_values_return_first_page(self):
+        """Курсор с чужими типами значений не роняет ленты и поиск."""
+        first = [post.id for post in self.get_page()]
+        pages = (
+            (self.INDEX_REVERSE, {}),
+            (reverse('posts:profile', args=(self.user.username,)), {}),
+            (reverse('posts:search'), {'q': 'Пост'}),
+            (reverse('posts:search'), {}),
+        )
+        forged = (
+            ['garbage', 5], [None, 1], [[1], {}],
+            ['2020-01-01T00:00:00+00:00', 10 ** 30],
+        )
+        for values in forged:
+            cursor = encode_cursor(NEXT, values)
+            for url, params in pages:
+                with self.subTest(values=values, url=url, params=params):
+                    response = self.guest_client.get(
+                        url, {**params, 'cursor': cursor})
+                    self.assertEqual(response.status_code, 200)
+                    if url == self.INDEX_REVERSE:
+                        self.assertEqual(
+                            [post.id for post in response.context['page_obj']],
+                            first)
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.FOLLOW_INDEX_REVERSE = reverse('posts:follow_index')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def get_feed(self):
+        response = self.reader_client.get(self.FOLLOW_INDEX_REVERSE)
+        return list(response.context['page_obj'])
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков автора."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.reader, post=post).exists())
+        self.assertEqual(self.get_feed(), [post])
+
+    def test_unfollow_prunes_timeline(self):
+        """После отписки посты автора уходят из ленты."""
+        Post.objects.create(text='Старый пост', author=self.author)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(len(self.get_feed()), 1)
+        follow.delete()
+        self.assertFalse(self.reader.timeline.exists())
+
+    @override_settings(TIMELINE_SIZE=2)
+    def test_timeline_is_capped(self):
+        """Лента хранит не больше TIMELINE_SIZE записей."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(text=f'Пост {number}', author=self.author)
+            for number in range(3)
+        ]
+        self.assertEqual(
+            set(self.reader.timeline.values_list('post_id', flat=True)),
+            {posts[1].id, posts[2].id})
+
+    @override_settings(TIMELINE_SIZE=2)
+    def test_fan_out_queries_do_not_grow_with_followers(self):
+        """Раскладка поста и обрезка лент не идут по подписчику."""
+        readers = [
+            User.objects.create_user(username=f'fan{number}')
+            for number in range(20)
+        ]
+        for reader in readers:
+            Follow.objects.create(user=reader, author=self.author)
+        for number in range(2):
+            Post.objects.create(text=f'Пост {number}', author=self.author)
+        with CaptureQueriesContext(connection) as captured:
+            post = Post.objects.create(text='Третий', author=self.author)
+        self.assertLess(len(captured), 20)
+        for reader in readers[:3]:
+            self.assertIn(
+                post.id, reader.timeline.values_list('post_id', flat=True))
+            self.assertEqual(reader.timeline.count(), 2)
+
+    def test_feed_queries_do_not_grow_with_posts(self):
+        """Число запросов ленты не зависит от числа постов на странице."""
+        group = Group.objects.create(
+            title='Группа', slug='timeline-group', description='Описание')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text='Пост', author=self.author, group=group)
+        with CaptureQueriesContext(connection) as single:
+            self.get_feed()
+        for number in range(5):
+            Post.objects.create(
+                text=f'Пост {number}', author=self.author, group=group)
+        with self.assertNumQueries(len(single)):
+            self.get_feed()
+
+    def test_feed_is_index_range_without_count(self):
+        """Лента подписок листается по курсору диапазоном индекса."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        for number in range(settings.NUMBER_POSTS + 1):
+            Post.objects.create(text=f'Пост {number}', author=self.author)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.reader_client.get(self.FOLLOW_INDEX_REVERSE)
+        page = response.context['cursor_page']
+        self.assertTrue(page.has_next())
+        feed_sql = [
+            query['sql'] for query in captured.captured_queries
+            if 'posts_timelineentry' in query['sql']
+        ]
+        self.assertEqual(len(feed_sql), 1)
+        self.assertNotIn('COUNT(', feed_sql[0])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + feed_sql[0])
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('timeline_user_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertContains(response, f'href="?{page.next_query}"')
+        self.assertNotContains(response, '?page=')
+        response = self.reader_client.get(
+            f'{self.FOLLOW_INDEX_REVERSE}?{page.next_query}')
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']], ['Пост 0'])
+        self.assertTrue(response.context['cursor_page'].has_previous())
+
+    def test_rebuild_timelines_command(self):
+        """Команда rebuild_timelines восстанавливает ленты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Пост', author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.get_feed(), [post])
+
+
+class FeedQueriesTest(TestCase):
+    """Ленты берут посты через for_feed()/for_detail(): число запросов
+    не зависит от числа постов, а строки пользователей грузятся без
+    пароля и прочих невыводимых колонок."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='feed-author', first_name='Имя', last_name='Фамилия')
+        cls.reader = User.objects.create_user(username='feed-reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='feed-group', description='Описание')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for number in range(settings.NUMBER_POSTS + 2):
+            cls.post = Post.objects.create(
+                text=f'Пост {number}', author=cls.author, group=cls.group)
+        Comment.objects.create(post=cls.post, author=cls.reader, text='Да')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def assert_feed(self, client, url, queries):
+        with self.assertNumQueries(queries):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assert_lean(self, post):
+        self.assertIn('password', post.author.get_deferred_fields())
+        self.assertIn('description', post.group.get_deferred_fields())
+        self.assertFalse(post.get_deferred_fields() & {
+            'text', 'pub_date', 'image', 'comments_count'})
+
+    def test_feed_query_counts(self):
+        # Включая SAVEPOINT и RELEASE от ATOMIC_REQUESTS; у читателя ещё
+        # два запроса на сессию и пользователя.
+        pages = [
+            (self.client, reverse('posts:index'), 4),
+            (self.client, reverse(
+                'posts:group_list', args=(self.group.slug,)), 6),
+            (self.client, reverse(
+                'posts:profile', args=(self.author.username,)), 7),
+            (self.reader_client, reverse('posts:follow_index'), 5),
+        ]
+        for client, url, queries in pages:
+            with self.subTest(url=url):
+                response = self.assert_feed(client, url, queries)
+                page = response.context['page_obj']
+                self.assertEqual(len(page), settings.NUMBER_POSTS)
+                self.assert_lean(page[0])
+
+    def test_cached_feeds_do_not_read_posts(self):
+        """Лента из готового фрагмента {% cache %} не читает посты,
+        в том числе ради ключей кеша страниц."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.reader_client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    self.reader_client.get(url)
+                self.assertFalse([
+                    query['sql'] for query in queries.captured_queries
+                    if query['sql'].startswith('SELECT "posts_post"."id"')
+                ])
+
+    def test_detail_query_count(self):
+        response = self.assert_feed(
+            self.client,
+            reverse('posts:post_detail', args=(self.post.id,)), 6)
+        self.assert_lean(response.context['post'])
+        self.assertEqual(response.context['post'].comments_count, 1)
+        comment = response.context['comments'][0].root
+        self.assertIn('password', comment.author.get_deferred_fields())
+
+    def test_search_query_count(self):
+        response = self.assert_feed(
+            self.client, reverse('posts:search') + '?q=Пост', 4)
+        self.assert_lean(response.context['page_obj'][0])
+
+
+@override_settings(COMMENTS_PER_PAGE=10)
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='commenter')
+        cls.post = Post.objects.create(text='Обсуждаемый', author=cls.user)
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {n}')
+            for n in range(25))
+        threads.index_roots()
+        Post.objects.filter(pk=cls.post.pk).update(comments_count=25)
+        cls.DETAIL = reverse('posts:post_detail', args=(cls.post.id,))
+        cls.FRAGMENT = reverse('posts:comments', args=(cls.post.id,))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_detail_shows_first_page_and_counter_total(self):
+        """Под постом первая страница веток, всего — из счётчика."""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.DETAIL)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 10)
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, 'Комментарии: 25')
+        self.assertContains(response, 'data-load-more')
+        self.assertFalse(any(
+            'COUNT' in query['sql'] and 'posts_comment' in query['sql']
+            for query in captured.captured_queries))
+
+    def test_fragment_walks_all_comments_once(self):
+        """«Показать ещё» по курсору отдаёт каждую ветку один раз."""
+        page = self.client.get(self.DETAIL).context['comments']
+        seen = [thread.root.id for thread in page]
+        while page.has_next():
+            response = self.client.get(
+                f'{self.FRAGMENT}?{page.next_query}')
+            self.assertEqual(response.status_code, 200)
+            self.assertNotContains(response, '<html')
+            page = response.context['comments']
+            seen += [thread.root.id for thread in page]
+        self.assertEqual(len(page), 5)
+        self.assertNotContains(response, 'data-load-more')
+        self.assertEqual(
+            seen,
+            list(Comment.objects.filter(post=self.post).order_by(
+                '-id').values_list('id', flat=True)))
+
+    def test_new_comment_purges_cached_fragment(self):
+        with override_settings(PAGE_CACHE=True):
+            self.client.get(self.FRAGMENT)
+            Comment.objects.create(
+                post=self.post, author=self.user, text='Свежий')
+            response = self.client.get(self.FRAGMENT)
+        self.assertNotEqual(response.get('X-Page-Cache'), 'hit')
+        self.assertContains(response, 'Свежий')
+
+
+@override_settings(COMMENTS_PER_PAGE=2, COMMENT_REPLIES_PER_PAGE=2)
+class ThreadedCommentsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='replier')
+        cls.post = Post.objects.create(text='Ветки', author=cls.user)
+        cls.ADD_COMMENT = reverse('posts:add_comment', args=(cls.post.id,))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def reply(self, text, parent=None):
+        data = {'text': text}
+        if parent is not None:
+            data['parent'] = parent.id
+        self.client.post(self.ADD_COMMENT, data)
+        return Comment.objects.get(text=text)
+
+    def test_replies_are_ordered_depth_first(self):
+        first = self.reply('Первый')
+        second = self.reply('Второй')
+        answer = self.reply('Ответ', first)
+        nested = self.reply('Ответ на ответ', answer)
+        late = self.reply('Поздний ответ', first)
+        self.assertEqual(
+            (nested.thread_id, nested.depth, nested.parent_id),
+            (first.id, 2, answer.id))
+        self.assertEqual(
+            list(Comment.objects.order_by('path')),
+            [second, first, answer, nested, late])
+
+    def test_page_of_threads_is_one_query(self):
+        """Корни страницы и первые ответы каждой ветки — один запрос."""
+        roots = [self.reply(f'Ветка {n}') for n in range(3)]
+        for n in range(3):
+            self.reply(f'Ответ {n}', roots[2])
+        request = RequestFactory().get('/')
+        with CaptureQueriesContext(connection) as captured:
+            page = threads.get_thread_page(self.post, request)
+            shown = [
+                [comment.text for comment in thread.replies]
+                for thread in page
+            ]
+        self.assertEqual(len(captured), 1)
+        self.assertEqual(shown, [['Ответ 0', 'Ответ 1'], []])
+        self.assertEqual(page[0].next_after, 2)
+        self.assertTrue(page.has_next())
+
+    def test_replies_fragment_pages_thread(self):
+        root = self.reply('Ветка')
+        for n in range(5):
+            self.reply(f'Ответ {n}', root)
+        url = reverse('posts:replies', args=(self.post.id, root.id))
+        after, seen = 2, []
+        while after:
+            response = self.client.get(url, {'after': after})
+            self.assertEqual(response.status_code, 200)
+            replies = response.context['replies']
+            seen += [comment.text for comment in replies.comments]
+            after = replies.next_after
+        self.assertEqual(seen, ['Ответ 2', 'Ответ 3', 'Ответ 4'])
+
+    @override_settings(COMMENT_MAX_DEPTH=1)
+    def test_deep_reply_becomes_sibling(self):
+        root = self.reply('Ветка')
+        answer = self.reply('Ответ', root)
+        deep = self.reply('Глубже некуда', answer)
+        self.assertEqual((deep.parent_id, deep.depth), (root.id, 1))
+
+    def test_parent_from_other_post_is_rejected(self):
+        other = Post.objects.create(text='Другой', author=self.user)
+        foreign = Comment.objects.create(
+            post=other, author=self.user, text='Чужой')
+        response = self.client.post(
+            self.ADD_COMMENT, {'text': 'Ответ', 'parent': foreign.id})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Comment.objects.filter(text='Ответ').exists())
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='carded')
+        cls.reader = User.objects.create_user(username='card_reader')
+        cls.group = Group.objects.create(
+            title='Старое название', slug='cards', description='Описание')
+        cls.post = Post.objects.create(
+            text='Текст карточки', author=cls.author, group=cls.group)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.FOLLOW = reverse('posts:follow_index')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def rename(self):
+        self.group.title = 'Новое название'
+        self.group.slug = 'renamed'
+        self.group.save()
+        self.author.first_name = 'Лев'
+        self.author.save()
+
+    def test_page_reads_cards_with_one_get_many(self):
+        self.client.get(self.FOLLOW)
+        with mock.patch.object(
+                cards.cache, 'get_many', wraps=cards.cache.get_many
+        ) as get_many, mock.patch.object(cards, 'get_template') as render:
+            response = self.client.get(self.FOLLOW)
+        get_many.assert_called_once()
+        render.assert_not_called()
+        self.assertContains(response, 'Текст карточки')
+
+    def test_edit_replaces_card(self):
+        self.client.get(self.FOLLOW)
+        self.author_client.post(
+            reverse('posts:edit', args=(self.post.id,)),
+            {'text': 'Новый текст', 'group': self.group.id})
+        response = self.client.get(self.FOLLOW)
+        self.assertContains(response, 'Новый текст')
+        self.assertNotContains(response, 'Текст карточки')
+
+    def test_group_and_author_changes_replace_card(self):
+        self.client.get(self.FOLLOW)
+        self.rename()
+        response = self.client.get(self.FOLLOW)
+        self.assertContains(response, 'Новое название')
+        self.assertContains(response, 'Лев')
+
+    def test_renames_change_etags_of_index_and_detail(self):
+        """Смена имени автора и группы меняет ETag главной и поста, а
+        новая главная ссылается на новый адрес группы."""
+        guest = Client()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:post_detail', args=(self.post.id,)),
+        )
+        etags = {url: guest.get(url)['ETag'] for url in urls}
+        self.rename()
+        for url in urls:
+            with self.subTest(url=url):
+                response = guest.get(url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Лев')
+                self.assertContains(
+                    response, reverse('posts:group_list', args=('renamed',)))
+                self.assertNotContains(
+                    response, reverse('posts:group_list', args=('cards',)))
+
+    @override_settings(PAGE_CACHE=True)
+    def test_renames_purge_cached_pages(self):
+        guest = Client()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:post_detail', args=(self.post.id,)),
+            reverse('posts:profile', args=(self.author.username,)),
+        )
+        for url in urls:
+            guest.get(url)
+        self.rename()
+        for url in urls:
+            with self.subTest(url=url):
+                response = guest.get(url)
+                self.assertNotEqual(response.get('X-Page-Cache'), 'hit')
+                self.assertContains(response, 'Лев')
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='searcher')
+        cls.group = Group.objects.create(
+            title='Группа поиска',
+            slug='search',
+            description='Описание',
+        )
+        cls.in_group = Post.objects.create(
+            text='Котики и собаки', author=cls.user, group=cls.group)
+        cls.best = Post.objects.create(
+            text='Котики котики котики', author=cls.user)
+        Post.objects.create(text='Про погоду', author=cls.user)
+        cls.SEARCH_REVERSE = reverse('posts:search')
+
+    def search(self, **params):
+        response = self.client.get(self.SEARCH_REVERSE, params)
+        return list(response.context['page_obj'])
+
+    def test_search_is_ranked(self):
+        """Поиск находит посты по началу слова и сортирует по рангу."""
+        self.assertEqual(self.search(q='котик'), [self.best, self.in_group])
+
+    def test_search_filters_by_group_and_author(self):
+        """Поиск фильтруется по группе и автору."""
+        self.assertEqual(
+            self.search(q='котики', group=self.group.slug), [self.in_group])
+        self.assertEqual(self.search(q='котики', author='nobody'), [])
+
+    def test_search_index_follows_edits(self):
+        """Индекс поиска обновляется при правке и удалении поста."""
+        post = Post.objects.get(pk=self.best.pk)
+        post.text = 'Попугаи'
+        post.save()
+        self.assertEqual(self.search(q='попугаи'), [post])
+        self.assertEqual(self.search(q='котики'), [self.in_group])
+        Post.objects.filter(pk=self.in_group.pk).delete()
+        self.assertEqual(self.search(q='котики'), [])
+
+    @override_settings(NUMBER_POSTS=1)
+    def test_search_pages_by_cursor(self):
+        """Результаты поиска листаются курсором."""
+        response = self.client.get(self.SEARCH_REVERSE, {'q': 'котики'})
+        page = response.context['page_obj']
+        self.assertEqual(list(page), [self.best])
+        response = self.client.get(
+            f'{self.SEARCH_REVERSE}?{page.next_query}')
+        self.assertEqual(
+            list(response.context['page_obj']), [self.in_group])
+
+    def test_admin_uses_search_index(self):
+        """Поиск в админке идёт через полнотекстовый индекс."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'котик'})
+        self.assertEqual(
+            set(response.context['cl'].result_list),
+            {self.best, self.in_group})
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.group = Group.objects.create(
+            title='Группа', slug='etag-group', description='Описание')
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def revalidate(self, client, url):
+        etag = client.get(url)['ETag']
+        return client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_not_modified(self):
+        """Неизменившиеся страницы отвечают 304 без тела."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        )
+        for url in urls:
+            for client in (self.client, self.authorized_client):
+                with self.subTest(url=url):
+                    response = self.revalidate(client, url)
+                    self.assertEqual(response.status_code, 304)
+                    self.assertEqual(response.content, b'')
+
+    def test_changes_invalidate_validators(self):
+        """Новый пост, комментарий и подписка меняют ETag страниц."""
+        changes = {
+            reverse('posts:index'): lambda: Post.objects.create(
+                text='Новый', author=self.author),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}):
+                lambda: Comment.objects.create(
+                    post=self.post, author=self.user, text='Комментарий'),
+            reverse('posts:profile', kwargs={'username': self.author}):
+                lambda: Follow.objects.create(
+                    user=self.user, author=self.author),
+        }
+        for url, change in changes.items():
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                change()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_follow_changes_follower_profile_etag(self):
+        """Подписка меняет ETag профиля читателя: у него растёт число
+        подписок."""
+        url = reverse('posts:profile', kwargs={'username': self.user})
+        etag = self.client.get(url)['ETag']
+        Follow.objects.create(user=self.user, author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'подписок: 1')
+
+    def test_validators_depend_on_user(self):
+        """ETag залогиненного пользователя не совпадает с анонимным."""
+        url = reverse('posts:index')
+        anonymous = self.client.get(url)
+        authorized = self.authorized_client.get(url)
+        self.assertNotEqual(anonymous['ETag'], authorized['ETag'])
+        self.assertTrue(anonymous.has_header('Last-Modified'))
+        self.assertFalse(authorized.has_header('Last-Modified'))
+        response = self.authorized_client.get(
+            url, HTTP_IF_NONE_MATCH=anonymous['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since(self):
+        """Аноним с If-Modified-Since получает 304."""
+        url = reverse('posts:index')
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_objects_still_404(self):
+        """Для несуществующих объектов валидаторов нет, ответ 404."""
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+@override_settings(PAGE_CACHE=True)
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.group = Group.objects.create(
+            title='Группа', slug='cached-group', description='Описание')
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group)
+        cls.INDEX_URL = reverse('posts:index')
+        cls.GROUP_URL = reverse(
+            'posts:group_list', kwargs={'slug': cls.group.slug})
+        cls.PROFILE_URL = reverse(
+            'posts:profile', kwargs={'username': cls.author})
+        cls.READER_URL = reverse(
+            'posts:profile', kwargs={'username': cls.user})
+        cls.DETAIL_URL = reverse(
+            'posts:post_detail', kwargs={'post_id': cls.post.id})
+
+    def setUp(self):
+        cache.clear()
+
+    def cached(self, url):
+        return self.client.get(url)['X-Page-Cache'] == 'hit'
+
+    def test_anonymous_pages_cached_with_surrogate_keys(self):
+        """Страницы для анонимов кешируются и несут Surrogate-Key."""
+        response = self.client.get(self.INDEX_URL)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertEqual(response['Surrogate-Key'], 'index')
+        self.assertIn('s-maxage=', response['Cache-Control'])
+        hit = self.client.get(self.INDEX_URL)
+        self.assertEqual(hit['X-Page-Cache'], 'hit')
+        self.assertEqual(hit.content, response.content)
+        not_modified = self.client.get(
+            self.INDEX_URL, HTTP_IF_NONE_MATCH=hit['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_authorized_pages_not_cached(self):
+        """Страницы для залогиненных не кешируются ни у нас, ни у прокси."""
+        self.client.force_login(self.user)
+        self.client.get(self.INDEX_URL)
+        response = self.client.get(self.INDEX_URL)
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.assertFalse(response.has_header('Surrogate-Key'))
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_changes_purge_only_affected_pages(self):
+        """Изменения сбрасывают только страницы со своими ключами."""
+        other = User.objects.create_user(username='other')
+        changes = (
+            (lambda: Comment.objects.create(
+                post=self.post, author=self.user, text='Комментарий'),
+             [self.DETAIL_URL]),
+            (lambda: Follow.objects.create(user=self.user, author=self.author),
+             [self.PROFILE_URL, self.READER_URL]),
+            (lambda: Post.objects.create(text='Без группы', author=other),
+             [self.INDEX_URL]),
+            (lambda: Post.objects.create(text='Ещё пост', author=self.author),
+             [self.INDEX_URL, self.PROFILE_URL, self.DETAIL_URL]),
+            (lambda: Post.objects.filter(pk=self.post.pk).first().save(),
+             [self.INDEX_URL, self.GROUP_URL, self.PROFILE_URL,
+              self.DETAIL_URL]),
+        )
+        urls = (self.INDEX_URL, self.GROUP_URL, self.PROFILE_URL,
+                self.READER_URL, self.DETAIL_URL)
+        for change, purged in changes:
+            for url in urls:
+                self.client.get(url)
+            change()
+            for url in urls:
+                with self.subTest(url=url):
+                    self.assertEqual(self.cached(url), url not in purged)
+
+    @override_settings(PAGE_CACHE_PURGE_URL='http://127.0.0.1:6081/')
+    def test_proxy_purge_request(self):
+        """Прокси получает PURGE с ключами сброшенных страниц."""
+        with mock.patch('urllib.request.urlopen') as urlopen:
+            cache_module._purge_proxy(['post-1', 'index'])
+        request = urlopen.call_args[0][0]
+        self.assertEqual(request.get_method(), 'PURGE')
+        self.assertEqual(request.get_header('Surrogate-key'), 'post-1 index')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name='small.gif', content=SMALL_GIF,
+                content_type='image/gif'),
+        )
+
+    def test_feed_does_not_render_thumbnails(self):
+        """Лента не создаёт миниатюру, а выводит заглушку."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'bg-secondary')
+        self.assertFalse(any(get_variants(self.post).values()))
+
+    def test_feed_renders_generated_thumbnails(self):
+        """После generate_thumbnails лента показывает готовую миниатюру."""
+        generate_thumbnails(self.post)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<img class="card-img my-2"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, ' 320w, ')
+        self.assertContains(response, ' 1920w"')
+        self.assertNotContains(response, 'bg-secondary')
+
+    def test_command_skips_broken_images(self):
+        """generate_thumbnails сообщает о битой картинке и обрабатывает
+        остальные."""
+        broken = Post.objects.create(
+            text='Битая картинка', author=self.user,
+            image=SimpleUploadedFile(
+                name='broken.gif', content=b'not an image',
+                content_type='image/gif'))
+        stdout, stderr = StringIO(), StringIO()
+        with self.assertLogs('sorl.thumbnail'), \
+                self.assertLogs('posts.thumbnails', 'ERROR'):
+            call_command(
+                'generate_thumbnails', stdout=stdout, stderr=stderr)
+        self.assertIn(f'Пост {broken.pk}: ', stderr.getvalue())
+        self.assertIn('Обработано картинок: 1', stdout.getvalue())
+        self.assertIn('Не удалось обработать: 1', stdout.getvalue())
+        self.assertTrue(all(get_variants(self.post).values()))
+
+    def test_variants_not_wider_than_source(self):
+        """Варианты шире исходной картинки не создаются."""
+        self.post.image_width = 700
+        self.assertEqual(variant_widths(self.post), [320, 640])
+        self.post.image_width = 100
+        self.assertEqual(variant_widths(self.post), [320])
+
+    def test_post_without_image_has_no_placeholder(self):
+        """Для поста без картинки не выводится ни картинка, ни заглушка."""
+        Post.objects.filter(pk=self.post.pk).update(image='')
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'bg-secondary')
+        self.assertNotContains(response, '<picture>')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageJobTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='uploader')
+        cls.post = Post.objects.create(text='Пост', author=cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_post_create_enqueues_job(self):
+        """Загрузка картинки ставит задание в очередь и не ждёт его."""
+        self.client.force_login(self.user)
+        self.client.post(reverse('posts:create'), {
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(
+                name='small.gif', content=SMALL_GIF,
+                content_type='image/gif'),
+        })
+        post = Post.objects.latest('id')
+        self.assertEqual(
+            list(post.image_jobs.values_list('kind', 'status')),
+            [('thumbnails', ImageJob.PENDING)])
+
+    def test_run_job_marks_done(self):
+        """Успешное задание помечается выполненным."""
+        job = jobs.enqueue(self.post, 'thumbnails')
+        self.assertEqual(jobs.claim(10), [job.id])
+        self.assertEqual(jobs.claim(10), [])
+        self.assertEqual(jobs.run_job(job.id), ImageJob.DONE)
+
+    @override_settings(IMAGE_JOB_MAX_ATTEMPTS=2, IMAGE_JOB_RETRY_DELAY=60)
+    def test_failing_job_backs_off_then_fails(self):
+        """Задание с битой картинкой откладывается, а потом считается
+        отравленным."""
+        broken = Post.objects.create(
+            text='Битая картинка', author=self.user,
+            image=SimpleUploadedFile(
+                name='broken.gif', content=b'not an image',
+                content_type='image/gif'))
+        job = jobs.enqueue(broken, 'thumbnails')
+        with self.assertLogs('sorl.thumbnail'), \
+                self.assertLogs('posts.thumbnails', 'ERROR'):
+            jobs.claim(10)
+            self.assertEqual(jobs.run_job(job.id), ImageJob.PENDING)
+            job.refresh_from_db()
+            self.assertGreater(job.run_after, timezone.now())
+            self.assertIn('не создана', job.last_error)
+            ImageJob.objects.filter(id=job.id).update(
+                run_after=timezone.now())
+            jobs.claim(10)
+            self.assertEqual(jobs.run_job(job.id), ImageJob.FAILED)
+        self.assertEqual(jobs.claim(10), [])
+
+    def test_status_view_is_for_staff(self):
+        """Статус очереди виден только персоналу."""
+        jobs.enqueue(self.post, 'thumbnails')
+        url = reverse('posts:image_jobs_status')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url)
+        self.assertEqual(response.json()['counts'][ImageJob.PENDING], 1)
+
+
+class BenchmarkTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Seeder().run(users=10, posts=50, comments=30, follows=15, groups=2)
+
+    def test_all_views_measured(self):
+        """Замер даёт перцентили, число запросов и память и не оставляет
+        записей в базе."""
+        posts, comments = Post.objects.count(), Comment.objects.count()
+        results = benchmark.run(
+            iterations=3, warmup=1, memory_iterations=1)
+        self.assertEqual(list(results), list(benchmark.VIEWS))
+        for row in results.values():
+            self.assertLessEqual(row['p50_ms'], row['p99_ms'])
+            self.assertGreater(row['queries'], 0)
+            self.assertGreater(row['peak_memory_kb'], 0)
+        self.assertEqual(Post.objects.count(), posts)
+        self.assertEqual(Comment.objects.count(), comments)
+
+    def test_compare_reports_regressions(self):
+        baseline = {'small': {'index': {'p95_ms': 10.0, 'queries': 4}}}
+        faster = {'small': {'index': {'p95_ms': 11.0, 'queries': 4}}}
+        slower = {'small': {'index': {'p95_ms': 13.0, 'queries': 5}}}
+        self.assertEqual(benchmark.compare(faster, baseline, 0.2), [])
+        self.assertEqual(len(benchmark.compare(slower, baseline, 0.2)), 2)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([5], 95), 5)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class LoadTestTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Seeder().run(users=10, posts=50, comments=30, follows=15, groups=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_worker_runs_weighted_scenarios(self):
+        """Воркер в процессе гоняет все сценарии без ошибок."""
+        mix = {name: 1 for name in loadtest.SCENARIOS}
+        targets = loadtest.collect_targets(readers=1)
+        samples = loadtest.run_worker(
+            0, mix, targets, started=time.time(), duration=2)
+        self.assertEqual(
+            {sample.scenario for sample in samples}, set(mix))
+        self.assertFalse(any(sample.error for sample in samples))
+        self.assertTrue(Post.objects.filter(
+            text='Пост нагрузочного теста').exclude(image='').exists())
+
+    def test_report_by_time_and_scenario(self):
+        samples = [
+            loadtest.Sample(0, 'index', 10.0, False),
+            loadtest.Sample(1, 'index', 30.0, True),
+            loadtest.Sample(2, 'profile', 20.0, False),
+        ]
+        report = loadtest.report(samples, duration=4, interval=2)
+        self.assertEqual(report['total']['requests'], 3)
+        self.assertEqual(report['scenarios']['index']['errors'], 0.5)
+        self.assertEqual(
+            [window['requests'] for window in report['timeline']], [2, 1])
+        self.assertEqual(report['timeline'][0]['rps'], 1.0)
+
+    def test_parse_mix(self):
+        self.assertEqual(
+            loadtest.parse_mix('index=3,post_create=0.5'),
+            {'index': 3.0, 'post_create': 0.5})
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('unknown=1')
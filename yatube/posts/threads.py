@@ -0,0 +1,136 @@
+"""Ветки комментариев с материализованным путём.
+
+Путь корня — дополнение его id до ROOT_MAX, поэтому по возрастанию пути
+новые ветки идут первыми. Путь ответа — путь родителя и номер ответа в
+ветке через «/», так что сортировка по path обходит ветку в глубину,
+а ответы одного родителя идут по времени. Номер ответа (position) берётся
+из счётчика last_reply корня и служит курсором постраничного вывода
+внутри ветки.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CharField, ExpressionWrapper, F, IntegerField
+from django.db.models import Value
+from django.db.models.functions import Cast, LPad
+
+from .models import Comment
+from .utils import NEXT, CursorPage, CursorPaginator, decode_cursor
+
+ROOT_WIDTH = 10
+ROOT_MAX = 10 ** ROOT_WIDTH - 1
+REPLY_WIDTH = 7
+
+COMMENT_FIELDS = (
+    'text', 'created', 'post_id', 'author__username', 'parent_id',
+    'thread_id', 'path', 'depth', 'position', 'last_reply',
+)
+
+# Ответы ветки после номера after; next_after — курсор следующей пачки.
+Replies = namedtuple('Replies', 'thread comments next_after')
+
+
+def root_path(comment_id):
+    return f'{ROOT_MAX - comment_id:0{ROOT_WIDTH}d}'
+
+
+def place(comment):
+    """Заполнить ветку, уровень, номер и путь нового ответа.
+
+    Слишком глубокий ответ встаёт рядом с родителем, иначе путь растёт
+    без ограничений. Номер выдаёт UPDATE счётчика корня: строка
+    блокируется до конца транзакции, и номера не повторяются.
+    """
+    parent = comment.parent
+    while parent.depth >= settings.COMMENT_MAX_DEPTH:
+        parent = parent.parent
+    with transaction.atomic():
+        root = Comment.objects.filter(pk=parent.thread_id)
+        root.update(last_reply=F('last_reply') + 1)
+        position = root.values_list('last_reply', flat=True).get()
+    comment.parent = parent
+    comment.thread_id = parent.thread_id
+    comment.depth = parent.depth + 1
+    comment.position = position
+    comment.path = f'{parent.path}/{position:0{REPLY_WIDTH}d}'
+
+
+def index_root(comment):
+    """Корень узнаёт свой путь только после INSERT, когда есть id."""
+    comment.thread_id = comment.pk
+    comment.path = root_path(comment.pk)
+    Comment.objects.filter(pk=comment.pk).update(
+        thread_id=comment.thread_id, path=comment.path)
+
+
+def index_roots(queryset=None):
+    """Проставить ветку и путь корням, записанным в обход сигналов:
+    bulk_create в manage.py seed и старые комментарии в миграции."""
+    if queryset is None:
+        queryset = Comment.objects.all()
+    distance = ExpressionWrapper(
+        Value(ROOT_MAX) - F('pk'), output_field=IntegerField())
+    return queryset.filter(parent__isnull=True, thread__isnull=True).update(
+        thread=F('pk'),
+        path=LPad(Cast(distance, CharField()), ROOT_WIDTH, Value('0')),
+    )
+
+
+class Thread:
+    """Корень ветки и первые ответы из одной выборки."""
+
+    def __init__(self, root):
+        self.root = root
+        self.replies = []
+
+    @property
+    def path(self):
+        return self.root.path
+
+    @property
+    def next_after(self):
+        shown = settings.COMMENT_REPLIES_PER_PAGE
+        return shown if self.root.last_reply > shown else None
+
+
+def get_thread_page(post, request):
+    """Страница веток поста, новые сверху, с первыми ответами каждой.
+
+    Корни страницы выбираются подзапросом, поэтому корни и ответы
+    приходят одним запросом, упорядоченным по пути.
+    """
+    roots = post.comments.filter(depth=0).order_by('path')
+    # Пагинатор только кодирует курсор; выборку строим сами.
+    paginator = CursorPaginator(roots, settings.COMMENTS_PER_PAGE, ('path',))
+    cursor = request.GET.get('cursor')
+    decoded = decode_cursor(cursor) if cursor else None
+    after = None
+    if decoded and decoded[0] == NEXT and len(decoded[1]) == 1:
+        after = str(decoded[1][0])
+        roots = roots.filter(path__gt=after)
+    comments = Comment.objects.filter(
+        thread__in=roots.values('pk')[:paginator.per_page + 1],
+        position__lte=settings.COMMENT_REPLIES_PER_PAGE,
+    ).select_related('author').only(*COMMENT_FIELDS).order_by('path')
+    threads = []
+    for comment in comments:
+        if comment.depth == 0:
+            threads.append(Thread(comment))
+        else:
+            threads[-1].replies.append(comment)
+    return CursorPage(
+        threads[:paginator.per_page], paginator, after is not None,
+        len(threads) > paginator.per_page, request.GET)
+
+
+def get_replies(thread, request):
+    """Следующая пачка ответов ветки после номера из параметра after."""
+    after = request.GET.get('after', '')
+    after = int(after) if after.isdigit() else 0
+    last = after + settings.COMMENT_REPLIES_PER_PAGE
+    comments = list(thread.thread_comments.filter(
+        position__gt=after, position__lte=last,
+    ).select_related('author').only(*COMMENT_FIELDS).order_by('path'))
+    return Replies(
+        thread, comments, last if thread.last_reply > last else None)
@@ -0,0 +1,134 @@
+import logging
+import time
+
+from django.conf import settings
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from core import metrics
+
+from .cache import bump_version, feed_page_keys, post_scopes, purge_pages
+from .cards import touch_posts
+from .images import output_format
+from .jobs import enqueue
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+
+class PregeneratedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, который не рисует миниатюры в шаблонах.
+
+    Тег {% thumbnail %} только ищет готовую миниатюру в хранилище ключей
+    и, если её нет, выводит блок {% empty %}. Создаёт миниатюры
+    generate_thumbnails() после загрузки картинки.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if options.pop('generate', False):
+            thumbnail = super().get_thumbnail(
+                file_, geometry_string, **options)
+            # sorl только пишет в лог, что исходник не читается, и отдаёт
+            # несозданную миниатюру; задание должно об этом узнать.
+            if not default.kvstore.get(thumbnail):
+                raise OSError(
+                    f'Миниатюра {geometry_string} для {file_} не создана')
+            return thumbnail
+        return self.get_cached_thumbnail(file_, geometry_string, **options)
+
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+def variant_formats():
+    """Форматы вариантов: основной и запасной JPEG для старых браузеров."""
+    if output_format() == 'JPEG':
+        return ('JPEG',)
+    return (output_format(), 'JPEG')
+
+
+def variant_geometry(width):
+    ratio_width, ratio_height = settings.POST_IMAGE_RATIO
+    return f'{width}x{round(width * ratio_height / ratio_width)}'
+
+
+def variant_options(image_format):
+    return {'crop': 'center', 'upscale': False, 'format': image_format}
+
+
+def variant_widths(post):
+    """Ширины вариантов, не превышающие ширину исходной картинки."""
+    widths = sorted(settings.POST_IMAGE_WIDTHS)
+    if not post.image_width:
+        return widths
+    return [
+        width for width in widths if width <= post.image_width
+    ] or widths[:1]
+
+
+def get_variants(post):
+    """Готовые варианты картинки: {формат: [(ширина, миниатюра), ...]}.
+
+    Только ищет миниатюры в хранилище ключей; ненайденные пропускает.
+    """
+    variants = {}
+    for image_format in variant_formats():
+        found = []
+        for width in variant_widths(post):
+            thumbnail = get_thumbnail(
+                post.image, variant_geometry(width),
+                **variant_options(image_format))
+            if thumbnail is not None:
+                found.append((width, thumbnail))
+        variants[image_format] = found
+    return variants
+
+
+def generate_thumbnails(post):
+    """Создать все варианты картинки поста из settings.POST_IMAGE_WIDTHS."""
+    if not post.image:
+        return
+    started = time.perf_counter()
+    failed = []
+    for image_format in variant_formats():
+        for width in variant_widths(post):
+            geometry = variant_geometry(width)
+            try:
+                get_thumbnail(
+                    post.image, geometry, generate=True,
+                    **variant_options(image_format))
+            except Exception as error:
+                logger.exception(
+                    'Не удалось создать миниатюру %s %s для поста %s',
+                    geometry, image_format, post.pk)
+                failed.append(error)
+    metrics.observe(
+        'yatube_thumbnail_generation_seconds',
+        time.perf_counter() - started)
+    if failed:
+        # run_job отложит задание, а после IMAGE_JOB_MAX_ATTEMPTS попыток
+        # пометит его FAILED; готовые варианты повтор возьмёт из кеша.
+        raise failed[0]
+    # Закешированные ленты показывают заглушку вместо картинки; миниатюры
+    # общие у всех постов с этим файлом.
+    bump_version(*post_scopes(post.author_id, post.group_id))
+    touch_posts(Post.objects.filter(image=post.image.name))
+    purge_pages(*feed_page_keys(post))
+
+
+def queue_thumbnails(post):
+    """Поставить создание миниатюр в очередь manage.py image_worker."""
+    enqueue(post, 'thumbnails')
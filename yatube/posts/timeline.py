@@ -0,0 +1,120 @@
+import heapq
+from collections import defaultdict
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import QuerySet
+
+from .models import Follow, Post, TimelineEntry
+
+
+def fan_out(post):
+    """Положить новый пост в ленты всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers],
+        ignore_conflicts=True,
+    )
+    trim(followers)
+
+
+def backfill(user_id, author_id):
+    """Дополнить ленту читателя последними постами нового автора."""
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('id', 'pub_date')[:settings.TIMELINE_SIZE]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts],
+        ignore_conflicts=True,
+    )
+    trim([user_id])
+
+
+def prune(user_id, author_id):
+    """Убрать из ленты читателя посты автора, от которого он отписался."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def trim(user_ids):
+    """Оставить в каждой ленте не больше TIMELINE_SIZE записей.
+
+    user_ids — список id читателей или queryset с одной колонкой id.
+    Лишние записи всех лент удаляет один DELETE: ROW_NUMBER() нумерует
+    записи каждой ленты от новых к старым, и удаляются только номера
+    больше TIMELINE_SIZE, так что ленты в пределах размера не меняются.
+    """
+    if isinstance(user_ids, QuerySet):
+        users, params = user_ids.query.sql_with_params()
+    elif user_ids:
+        users, params = ', '.join(['%s'] * len(user_ids)), list(user_ids)
+    else:
+        return
+    table = TimelineEntry._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE id IN ('
+            'SELECT id FROM ('
+            'SELECT id, ROW_NUMBER() OVER ('
+            'PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC'
+            f') AS place FROM {table} WHERE user_id IN ({users})'
+            ') ranked WHERE place > %s)',
+            [*params, settings.TIMELINE_SIZE])
+
+
+def rebuild(user_id):
+    """Пересобрать ленту читателя с нуля по Follow и Post."""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    posts = Post.objects.filter(
+        author__following__user_id=user_id,
+    ).order_by('-pub_date').values_list(
+        'id', 'pub_date')[:settings.TIMELINE_SIZE]
+    TimelineEntry.objects.bulk_create(
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts
+    )
+
+
+def rebuild_all(batch_size=10000):
+    """Пересобрать ленты всех читателей разом, например после seed.
+
+    Последние TIMELINE_SIZE постов каждого автора читаются один раз,
+    а лента читателя собирается слиянием списков его авторов; записи
+    вставляются пачками без создания объектов моделей.
+    """
+    size = settings.TIMELINE_SIZE
+    adapt = connection.ops.adapt_datetimefield_value
+    recent = defaultdict(list)
+    posts = Post.objects.order_by('-pub_date', '-id').values_list(
+        'pub_date', 'id', 'author_id')
+    for pub_date, post_id, author_id in posts.iterator():
+        if len(recent[author_id]) < size:
+            recent[author_id].append((adapt(pub_date), post_id))
+    follows = Follow.objects.order_by('user_id').values_list(
+        'user_id', 'author_id')
+    table = TimelineEntry._meta.db_table
+    TimelineEntry.objects.all().delete()
+    with connection.cursor() as cursor:
+        rows = []
+        for user_id, pairs in groupby(follows.iterator(), itemgetter(0)):
+            merged = heapq.merge(
+                *(recent[author_id] for _, author_id in pairs),
+                reverse=True)
+            rows.extend(
+                (user_id, post_id, pub_date)
+                for pub_date, post_id in islice(merged, size))
+            if len(rows) >= batch_size:
+                _insert_entries(cursor, table, rows)
+                rows = []
+        _insert_entries(cursor, table, rows)
+
+
+def _insert_entries(cursor, table, rows):
+    if rows:
+        cursor.executemany(
+            f'INSERT INTO {table} (user_id, post_id, pub_date) '
+            'VALUES (%s, %s, %s)', rows)
@@ -13,7 +13,19 @@ urlpatterns = [
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path(
         'posts/<int:post_id>/comment/', views.add_comment, name='add_comment'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.comments_fragment,
+        name='comments'
+    ),
+    path(
+        'posts/<int:post_id>/comments/<int:thread_id>/replies/',
+        views.replies_fragment,
+        name='replies'
+    ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search, name='search'),
+    path('jobs/status/', views.image_jobs_status, name='image_jobs_status'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -1,9 +1,211 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import QueryDict
+
+NEXT = 'n'
+PREVIOUS = 'p'
+# Пределы INTEGER в SQLite и BIGINT в других базах.
+MIN_INT = -2 ** 63
+MAX_INT = 2 ** 63 - 1
 
 
 def get_paginator(queryset, request):
+    if settings.CURSOR_PAGINATION or 'cursor' in request.GET:
+        return get_cursor_paginator(queryset, request)
     paginator = Paginator(queryset, settings.NUMBER_POSTS)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
+
+
+def get_cursor_paginator(queryset, request, ordering=('-pub_date', '-id')):
+    paginator = CursorPaginator(queryset, settings.NUMBER_POSTS, ordering)
+    return paginator.get_page(request.GET.get('cursor'), request.GET)
+
+
+def encode_cursor(direction, values):
+    values = [
+        value.isoformat() if isinstance(value, (date, datetime)) else value
+        for value in values
+    ]
+    raw = json.dumps([direction, values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Вернуть (направление, значения ключа) или None для битого курсора."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(raw.decode())
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+class CursorPaginator:
+    """Постраничный вывод по ключу (keyset) вместо COUNT(*) и OFFSET.
+
+    Страница выбирается условием по полям сортировки, поэтому стоимость
+    запроса не зависит от глубины страницы.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-pub_date', '-id')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [
+            (name.lstrip('-'), name.startswith('-')) for name in ordering
+        ]
+
+    def get_page(self, cursor=None, params=None):
+        decoded = decode_cursor(cursor) if cursor else None
+        if decoded is not None:
+            decoded = decoded[0], self._clean(decoded[1])
+        if decoded is None or decoded[1] is None:
+            decoded = (NEXT, None)
+        direction, values = decoded
+        backwards = direction == PREVIOUS
+        queryset = self.queryset.order_by(*self._ordering(backwards))
+        if values is not None:
+            queryset = queryset.filter(self._keyset(values, backwards))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards and not has_more:
+            # Дошли до начала ленты: отдаём полную первую страницу.
+            return self.get_page(None, params)
+        if backwards:
+            rows.reverse()
+            has_previous, has_next = True, True
+        else:
+            has_previous, has_next = values is not None, has_more
+        return CursorPage(rows, self, has_previous, has_next, params)
+
+    def cursor_for(self, obj, direction):
+        values = [getattr(obj, name) for name, _ in self.fields]
+        return encode_cursor(direction, values)
+
+    def _clean(self, values):
+        """Значения курсора в типах полей сортировки или None, если
+        курсор подделан или испорчен."""
+        if len(values) != len(self.fields):
+            return None
+        cleaned = []
+        for (name, _), value in zip(self.fields, values):
+            if value is None:
+                return None
+            try:
+                value = self._field(name).to_python(value)
+            except (FieldDoesNotExist, ValidationError, ValueError,
+                    TypeError):
+                return None
+            # Число вне INTEGER базы роняет запрос с OverflowError.
+            if isinstance(value, int) and not MIN_INT <= value <= MAX_INT:
+                return None
+            cleaned.append(value)
+        return cleaned
+
+    def _field(self, name):
+        """Поле или аннотация сортировки; rank поиска — аннотация."""
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.queryset.model._meta.get_field(name)
+
+    def _ordering(self, backwards):
+        if not backwards:
+            return self.ordering
+        return [
+            name if descending else f'-{name}'
+            for name, descending in self.fields
+        ]
+
+    def _keyset(self, values, backwards):
+        keyset = Q()
+        for index, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending != backwards else 'gt'
+            term = Q(**{f'{name}__{lookup}': values[index]})
+            for (prev_name, _), value in zip(self.fields, values[:index]):
+                term &= Q(**{prev_name: value})
+            keyset |= term
+        # Неравенство по первому полю отдельно, чтобы работал индекс.
+        name, descending = self.fields[0]
+        lookup = 'lte' if descending != backwards else 'gte'
+        return Q(**{f'{name}__{lookup}': values[0]}) & keyset
+
+
+class CursorPage:
+    cursor_based = True
+
+    def __init__(self, object_list, paginator, has_previous, has_next,
+                 params=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_previous = has_previous and bool(object_list)
+        self._has_next = has_next and bool(object_list)
+        self.params = params
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.cursor_for(self.object_list[-1], NEXT)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.cursor_for(self.object_list[0], PREVIOUS)
+        return None
+
+    @property
+    def first_query(self):
+        return self._query(None)
+
+    @property
+    def next_query(self):
+        return self._query(self.next_cursor)
+
+    @property
+    def previous_query(self):
+        return self._query(self.previous_cursor)
+
+    def _query(self, cursor):
+        if self.params is not None:
+            params = self.params.copy()
+        else:
+            params = QueryDict(mutable=True)
+        params.pop('page', None)
+        params.pop('cursor', None)
+        if cursor is not None:
+            params['cursor'] = cursor
+        return params.urlencode()
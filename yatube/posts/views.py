@@ -1,42 +1,84 @@
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db.models import F, FloatField, Value
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
-from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post
-from .utils import get_paginator
+from .cache import (add_surrogate_keys, feed_cache_context, feed_condition,
+                    group_surrogate_key)
+from .counters import get_user_counter
+from .forms import CommentForm, PostForm, SearchForm
+from .jobs import queue_status
+from .models import Comment, Follow, Group, Post
+from .threads import get_replies, get_thread_page
+from .thumbnails import queue_thumbnails
+from .utils import get_cursor_paginator, get_paginator
 
 User = get_user_model()
 
 
+def index_scopes():
+    return ['index']
+
+
+def group_scopes(slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'id', flat=True).first()
+    return [f'group:{group_id}'] if group_id else None
+
+
+def profile_scopes(username):
+    author_id = User.objects.filter(username=username).values_list(
+        'id', flat=True).first()
+    if author_id is None:
+        return None
+    return [f'author:{author_id}', f'followers:{author_id}']
+
+
+def detail_scopes(post_id, **kwargs):
+    author_id = Post.objects.filter(id=post_id).values_list(
+        'author_id', flat=True).first()
+    return [f'author:{author_id}'] if author_id else None
+
+
+@feed_condition(index_scopes)
 def index(request):
-    posts = Post.objects.select_related(
-        'author', 'group')[:settings.NUMBER_POSTS]
+    posts = Post.objects.for_feed()
     pagin = get_paginator(posts, request)
+    add_surrogate_keys(request, 'index')
     return render(request,
                   'posts/index.html',
-                  context={'posts': posts,
-                           'page_obj': pagin,
+                  context={'page_obj': pagin,
+                           **feed_cache_context('index'),
                            })
 
 
+@feed_condition(group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author')
+    posts = group.posts.for_feed()
     pagin = get_paginator(posts, request)
+    add_surrogate_keys(request, group_surrogate_key(group.slug))
     return render(request,
                   'posts/group_list.html',
                   context={'group': group,
                            'page_obj': pagin,
+                           **feed_cache_context(f'group:{group.id}'),
                            })
 
 
+@feed_condition(profile_scopes)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = Post.objects.select_related(
-        'group', 'author').filter(author=author)
+    author = get_object_or_404(
+        User.objects.only('username', 'first_name', 'last_name'),
+        username=username)
+    post_list = Post.objects.for_feed().filter(author=author)
     pagin = get_paginator(post_list, request)
+    add_surrogate_keys(
+        request, f'author-{author.id}', f'followers-{author.id}')
     following = request.user.is_authenticated
     if following:
         following = author.following.filter(user=request.user).exists()
@@ -44,24 +86,54 @@ def profile(request, username):
                   'posts/profile.html',
                   context={'author': author,
                            'username': username,
+                           'counters': get_user_counter(author),
                            'page_obj': pagin,
-                           'following': following, })
+                           'following': following,
+                           **feed_cache_context(f'author:{author.id}'),
+                           })
 
 
+@feed_condition(detail_scopes)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(Post.objects.for_detail(), id=post_id)
     post_detail = post.text
-    comments = post.comments.select_related('author')
+    comments = get_thread_page(post, request)
     form = CommentForm()
+    add_surrogate_keys(
+        request, f'post-{post.id}', f'comments-{post.id}',
+        f'author-{post.author_id}')
     return render(request,
                   'posts/post_detail.html',
                   context={'post': post,
                            'post_detail': post_detail,
+                           'posts_count': get_user_counter(
+                               post.author).posts_count,
                            'form': form,
                            'comments': comments,
                            })
 
 
+def search(request):
+    form = SearchForm(request.GET or None)
+    # Пустой выборке тоже нужен rank: по нему сортирует пагинатор.
+    posts = Post.objects.none().annotate(
+        rank=Value(0.0, output_field=FloatField()))
+    if form.is_valid():
+        posts = Post.objects.search(
+            form.cleaned_data['q']).for_feed()
+        if form.cleaned_data['group']:
+            posts = posts.filter(group=form.cleaned_data['group'])
+        if form.cleaned_data['author']:
+            posts = posts.filter(
+                author__username=form.cleaned_data['author'])
+    pagin = get_cursor_paginator(posts, request, ordering=('rank', 'id'))
+    return render(request,
+                  'posts/search.html',
+                  context={'form': form,
+                           'page_obj': pagin,
+                           })
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None,
@@ -70,6 +142,8 @@ def post_create(request):
         create_post = form.save(commit=False)
         create_post.author = request.user
         create_post.save()
+        if create_post.image:
+            queue_thumbnails(create_post)
         return redirect('posts:profile', create_post.author)
     return render(request, 'posts/create_post.html', context={'form': form})
 
@@ -86,6 +160,8 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            queue_thumbnails(edit_post)
         return redirect('posts:post_detail', post_id)
     return render(request,
                   'posts/create_post.html',
@@ -94,6 +170,30 @@ def post_edit(request, post_id):
                            'is_edit': True})
 
 
+@feed_condition(detail_scopes)
+def comments_fragment(request, post_id):
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+    add_surrogate_keys(request, f'comments-{post.id}')
+    return render(request,
+                  'includes/comment_list.html',
+                  context={'post': post,
+                           'comments': get_thread_page(post, request),
+                           })
+
+
+@feed_condition(detail_scopes)
+def replies_fragment(request, post_id, thread_id):
+    thread = get_object_or_404(
+        Comment.objects.only('post_id', 'last_reply'),
+        id=thread_id, post_id=post_id, depth=0)
+    add_surrogate_keys(request, f'comments-{post_id}')
+    return render(request,
+                  'includes/reply_list.html',
+                  context={'post_id': post_id,
+                           'replies': get_replies(thread, request),
+                           })
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -102,16 +202,35 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
+        parent_id = request.POST.get('parent', '')
+        if parent_id.isdigit():
+            comment.parent = get_object_or_404(post.comments, id=parent_id)
         comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
+    # Порядок и курсор — по колонкам записи ленты, чтобы страница
+    # читалась диапазоном индекса timeline_user_date_idx.
     posts = Post.objects.filter(
-        author__following__user=request.user)
-    pagin = get_paginator(posts, request)
-    return render(request, 'posts/follow.html', context={'page_obj': pagin})
+        timeline_entries__user=request.user,
+    ).annotate(
+        feed_date=F('timeline_entries__pub_date'),
+        feed_post=F('timeline_entries__post_id'),
+    ).for_feed()
+    cursor_page = get_cursor_paginator(
+        posts, request, ordering=('-feed_date', '-feed_post'))
+    # Шаблон выводит cursor_page со ссылками по курсору, как другие
+    # ленты; page_obj — те же посты в виде django Page для кода, который
+    # ждёт Page на /follow/.
+    page_obj = Paginator(
+        cursor_page.object_list, settings.NUMBER_POSTS).page(1)
+    return render(request,
+                  'posts/follow.html',
+                  context={'cursor_page': cursor_page,
+                           'page_obj': page_obj,
+                           })
 
 
 @login_required
@@ -131,3 +250,8 @@ def profile_unfollow(request, username):
     )
     user_follower.delete()
     return redirect('posts:profile', username)
+
+
+@staff_member_required
+def image_jobs_status(request):
+    return JsonResponse(queue_status())
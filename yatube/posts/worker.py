@@ -0,0 +1,17 @@
+"""Точки входа процессов пула image_worker.
+
+Модуль не импортирует модели на верхнем уровне: при запуске через spawn
+он загружается в новом процессе раньше, чем настроен Django.
+"""
+import django
+from django.db import connections
+
+
+def init_worker():
+    django.setup()
+    connections.close_all()
+
+
+def run_job(job_id):
+    from .jobs import run_job
+    return run_job(job_id)
@@ -38,11 +38,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'posts.middleware.AnonymousPageCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -75,6 +77,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Счётчики обновляются сигналами в той же транзакции, что и запрос.
+        'ATOMIC_REQUESTS': True,
     }
 }
 
@@ -115,6 +119,89 @@ DATE_FORMAT = 'd E Y'
 
 NUMBER_POSTS = 10
 
+# Ленты листаются по курсору (pub_date, id) вместо номера страницы.
+CURSOR_PAGINATION = False
+
+# Комментарии под постом — ветки, новые сверху; следующие ветки отдаёт
+# фрагментом posts:comments для кнопки «Показать ещё», следующие ответы
+# ветки — posts:replies. Ответы глубже COMMENT_MAX_DEPTH встают рядом
+# с родителем.
+COMMENTS_PER_PAGE = 20
+COMMENT_REPLIES_PER_PAGE = 3
+COMMENT_MAX_DEPTH = 5
+
+# Сколько последних постов хранится в ленте подписок каждого читателя.
+TIMELINE_SIZE = 1000
+
+# Фрагменты лент сбрасываются сигналами, поэтому живут долго.
+FEED_CACHE_TIMEOUT = 60 * 60
+
+# Карточки постов в лентах кешируются по id и updated поста; старые
+# версии не удаляются, а истекают через POST_CARD_CACHE_TIMEOUT.
+POST_CARD_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Статистика запросов: число и время SQL, повторы, время шаблонов и кеш.
+# Каждый запрос пишется строкой JSON в файл REQUEST_LOG_PATH; запросы,
+# где один SQL выполнился REQUEST_STATS_REPEAT_THRESHOLD раз и больше
+# (N+1), пишутся с уровнем WARNING. По умолчанию всё выключено, чтобы
+# тесты и команды manage.py не писали файлы в каталог проекта; на сервере
+# включается, например, REQUEST_LOG_PATH = '/var/log/yatube/requests.log'.
+REQUEST_STATS = False
+REQUEST_STATS_REPEAT_THRESHOLD = 5
+REQUEST_LOG_PATH = None
+
+# Метрики в формате Prometheus на /metrics. Каждый процесс копит значения
+# у себя и раз в METRICS_FLUSH_INTERVAL секунд складывает их в общий
+# файл SQLite, поэтому /metrics отдаёт сумму по всем воркерам gunicorn
+# и image_worker. Если METRICS_PATH = None (по умолчанию), метрики
+# не пишутся.
+METRICS_PATH = None
+METRICS_FLUSH_INTERVAL = 1
+# /metrics открыт сотрудникам и адресам из списка (сборщику Prometheus);
+# остальным — 403.
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(message)s'},
+    },
+    'handlers': {
+        'requests_file': {
+            'class': 'logging.FileHandler',
+            'filename': REQUEST_LOG_PATH,
+            'formatter': 'plain',
+            'delay': True,
+        } if REQUEST_LOG_PATH else {
+            'class': 'logging.NullHandler',
+        },
+    },
+    'loggers': {
+        'yatube.requests': {
+            'handlers': ['requests_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Защита фрагментов от одновременного пересчёта ({% load stampede %}):
+# значение пересчитывается заранее с вероятностью, зависящей от BETA,
+# только одним процессом; остальные ждут до CACHE_LOCK_WAIT секунд
+# или отдают старое значение, которое живёт ещё CACHE_STALE_TIMEOUT.
+CACHE_EARLY_RECOMPUTE_BETA = 1.0
+CACHE_LOCK_TIMEOUT = 30
+CACHE_LOCK_WAIT = 2
+CACHE_STALE_TIMEOUT = 5 * 60
+
+# Кеш целых страниц для анонимов (при DEBUG выключен) и s-maxage для
+# обратного прокси. На PAGE_CACHE_PURGE_URL уходит PURGE с ключами
+# сброшенных страниц в заголовке Surrogate-Key.
+PAGE_CACHE = not DEBUG
+PAGE_CACHE_TIMEOUT = 10 * 60
+PAGE_CACHE_PURGE_URL = None
+
 LOGIN_URL = 'users:login'
 
 LOGOUT_URL = 'users:logout'
@@ -130,6 +217,32 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Миниатюры создаются при загрузке, шаблоны берут только готовые.
+THUMBNAIL_BACKEND = 'posts.thumbnails.PregeneratedThumbnailBackend'
+
+# Варианты картинки поста для srcset: ширины, соотношение сторон кадра
+# и атрибут sizes. Каждая ширина создаётся в WebP и в JPEG для браузеров
+# без WebP.
+POST_IMAGE_WIDTHS = (320, 640, 960, 1920)
+POST_IMAGE_RATIO = (960, 339)
+POST_IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+
+# Картинки постов пересохраняются при загрузке: не больше IMAGE_MAX_SIZE,
+# без метаданных, в WebP (или JPEG, если Pillow собран без WebP).
+IMAGE_FORMAT = 'WEBP'
+IMAGE_QUALITY = 82
+IMAGE_MAX_SIZE = (1920, 1920)
+IMAGE_MAX_PIXELS = 50_000_000
+IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+
+# manage.py collect_images удаляет файлы без ссылок не моложе этого срока.
+IMAGE_GC_GRACE = 24 * 60 * 60
+
+# Очередь manage.py image_worker: повторы с экспоненциальной задержкой.
+IMAGE_JOB_MAX_ATTEMPTS = 5
+IMAGE_JOB_RETRY_DELAY = 30
+IMAGE_JOB_TIMEOUT = 10 * 60
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
@@ -143,7 +256,9 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Как DjangoTemplates, но сообщает время отрисовки в статистику
+        # запросов.
+        'BACKEND': 'core.templates.InstrumentedDjangoTemplates',
         # Добавлено: Искать шаблоны на уровне проекта
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
@@ -159,8 +274,44 @@ TEMPLATES = [
     }
 ]
 
-CACHES = {
-    'default': {
+# 'locmem' — свой кеш у каждого процесса, 'sqlite' — общий файл для всех
+# воркеров на машине: фрагменты считаются один раз, сброс версий виден
+# всем процессам.
+CACHE_BACKEND = 'locmem'
+
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'sqlite': {
+        'BACKEND': 'core.cache.sqlite.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100_000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
+    },
 }
+
+# Маленький LRU в памяти каждого процесса перед выбранным кешем. Копии
+# в памяти живут не дольше LOCAL_TIMEOUT и сверяются со штампами общего
+# кеша раз в STAMP_INTERVAL секунд.
+CACHE_LOCAL_TIER = False
+
+if CACHE_LOCAL_TIER:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.tiered.TieredCache',
+            'OPTIONS': {
+                'BACKEND': 'shared',
+                'LOCAL_MAX_ENTRIES': 1000,
+                'LOCAL_TIMEOUT': 5,
+                'STAMP_INTERVAL': 1,
+            },
+        },
+        'shared': CACHE_BACKENDS[CACHE_BACKEND],
+    }
+else:
+    CACHES = {
+        'default': CACHE_BACKENDS[CACHE_BACKEND],
+    }
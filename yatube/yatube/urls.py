@@ -4,6 +4,8 @@ from django.contrib import admin
 from django.contrib.auth.views import LoginView
 from django.urls import include, path
 
+from core.views import metrics, request_stats
+
 handler404 = 'core.views.page_not_found'
 handler500 = 'core.views.server_error'
 handler403 = 'core.views.permission_denied'
@@ -22,6 +24,8 @@ urlpatterns = [
         'about/',
         include('about.urls', namespace='about')
     ),
+    path('stats/requests/', request_stats, name='request_stats'),
+    path('metrics', metrics, name='metrics'),
 ]
 
 if settings.DEBUG: